@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+#
+# Bit Reader
+# Osteoclave
+# 2026-10-18
+#
+# Reads values of any bit width, most significant bit first, from a
+# bytes-like object. A faster replacement for reading compressed data with
+# bitstring: the bits are kept in an int, which is refilled a byte at a
+# time.
+#
+# This is a cut-down copy of snes/bitreader.py, with only what the M.C.
+# Kids decompressor needs. Fixes to one should go in the other, too.
+
+
+
+class BitReader:
+
+    def __init__(self, inBytes, startOffset=0):
+        self.inBytes = inBytes
+        self.inPos = startOffset
+        # The bits that have been read from the input, but not used yet.
+        self.bits = 0
+        self.bitCount = 0
+
+
+
+    # Read a value nbits bits long.
+    def read(self, nbits):
+        while self.bitCount < nbits:
+            self.bits = (self.bits << 8) | self.inBytes[self.inPos]
+            self.inPos += 1
+            self.bitCount += 8
+
+        self.bitCount -= nbits
+        value = self.bits >> self.bitCount
+        self.bits &= (1 << self.bitCount) - 1
+        return value
+
+
+
+    # Skip to the start of the next byte (unless already there).
+    def bytealign(self):
+        self.bitCount -= self.bitCount % 8
+        self.bits &= (1 << self.bitCount) - 1
+
+
+
+    # The position of the next byte to be read. (Only meaningful when
+    # byte-aligned.)
+    @property
+    def bytepos(self):
+        return self.inPos - self.bitCount // 8
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+#
+# Bit Writer
+# Osteoclave
+# 2026-10-18
+#
+# Writes values of any bit width, most significant bit first, and packs
+# them into bytes. A faster replacement for building compressed data one
+# bitstring.pack() at a time: the bits are kept in an int until there's
+# at least a byte's worth, and whole bytes go straight into a bytearray.
+#
+# This is a cut-down copy of snes/bitwriter.py, with only what the M.C.
+# Kids compressor needs. Fixes to one should go in the other, too.
+
+
+
+class BitWriter:
+
+    def __init__(self):
+        self.output = bytearray()
+        # The bits that don't make up a whole byte yet.
+        self.bits = 0
+        self.bitCount = 0
+
+
+
+    # Write a value as nbits bits. (It has to fit.)
+    def write(self, value, nbits):
+        if value < 0 or value >> nbits:
+            raise ValueError("{0:d} doesn't fit in {1:d} bits".format(value, nbits))
+        self.bits = (self.bits << nbits) | value
+        self.bitCount += nbits
+
+        # Move any whole bytes to the output.
+        if self.bitCount >= 8:
+            byteCount = self.bitCount >> 3
+            self.bitCount &= 0x07
+            self.output += (self.bits >> self.bitCount).to_bytes(byteCount, "big")
+            self.bits &= (1 << self.bitCount) - 1
+
+
+
+    # Return everything written so far as bytes. If the bits don't fill
+    # the last byte, it's padded with zero bits.
+    def tobytes(self):
+        if self.bitCount == 0:
+            return bytes(self.output)
+        return bytes(self.output) + bytes((self.bits << (8 - self.bitCount),))
@@ -5,85 +5,373 @@
 # 2012-11-16
 #
 # The compression format is described in the decompressor.
-#
-# This code uses python-bitstring:
-# https://pypi.org/project/bitstring/
 
+import concurrent.futures
+import multiprocessing
 import os
 import sys
-import bitstring
+import bitwriter
 
 
 
-def compress(inBytes, sourceArgSize, lengthArgSize):
-    # Define some useful constants.
-    BIT_PASTCOPY = 0
-    BIT_LITERAL = 1
+# Define some useful constants.
+BIT_PASTCOPY = 0
+BIT_LITERAL = 1
 
-    # Prepare for compression.
-    currentIndex = 0
+# The argument sizes are nybbles, and a source of 0 marks the end, so this
+# is as far back and as far ahead as a pastcopy can reach.
+MAX_ARG_SIZE = 15
+
+# How many commands a parallel sweep chooses between checks on whether
+# another combination has already done better.
+BEST_SIZE_CHECK_INTERVAL = 0x400
+
+
+
+# How far back a pastcopy can reach with a given source size. (The source
+# is the distance back, but the brute-force search this replaces never
+# used the largest one, and we keep it that way.)
+def maxDistance(sourceArgSize):
+    return (1 << sourceArgSize) - 2
+
+
+
+# How many bytes a pastcopy can copy with a given length size.
+def maxLength(lengthArgSize):
+    return (1 << lengthArgSize) - 1 + 3
+
+
+
+# Count how many sequential bytes match (at most limit), comparing the
+# data from two positions. The comparison may run past the later position.
+def matchLength(inBytes, source, current, limit):
+    # Compare the bytes as big integers. The highest set bit of their XOR
+    # is in the first byte that differs. Most matches are short, so try a
+    # few bytes before comparing everything.
+    shortLimit = min(limit, 16)
+    difference = (
+        int.from_bytes(inBytes[source:source + shortLimit], "big")
+        ^ int.from_bytes(inBytes[current:current + shortLimit], "big")
+    )
+    if difference == 0 and shortLimit < limit:
+        shortLimit = limit
+        difference = (
+            int.from_bytes(inBytes[source:source + limit], "big")
+            ^ int.from_bytes(inBytes[current:current + limit], "big")
+        )
+    return shortLimit - ((difference.bit_length() + 7) // 8)
+
+
+
+# Find the pastcopies at every position, up to distanceLimit bytes back and
+# lengthLimit bytes long. For each position, there's a list of (distance,
+# length) pairs, in increasing order of both: every time a longer match
+# turns up going back from the position, it's added to the list. That's
+# enough to find the best pastcopy for any smaller limits (see
+# chooseMatch()), so one table works for every argument size.
+#
+# Only matches of at least three bytes are worth listing, so the positions
+# are indexed by their first three bytes, and only positions with the same
+# three bytes are compared. Each position's chain of earlier ones is walked
+# from the closest back, until it's past distanceLimit. If maxChain isn't
+# None, at most that many earlier positions are looked at: this is faster,
+# but might miss some of the longer (more distant) matches.
+def findMatches(inBytes, distanceLimit, lengthLimit, maxChain=None):
     endIndex = len(inBytes)
-    output = bitstring.BitArray()
-    output += bitstring.pack("uint:4", sourceArgSize)
-    output += bitstring.pack("uint:4", lengthArgSize)
+    matchTable = [[] for i in range(endIndex)]
+    keyPositions = {}
 
-    # Main compression loop.
-    while currentIndex < endIndex:
-        bestSource = 0
+    for currentIndex in range(endIndex - 2):
+        key = (
+            (inBytes[currentIndex] << 16)
+            | (inBytes[currentIndex + 1] << 8)
+            | inBytes[currentIndex + 2]
+        )
+        positions = keyPositions.setdefault(key, [])
+        matches = matchTable[currentIndex]
+
+        # Don't look too far ahead.
+        lookaheadLimit = min(lengthLimit, endIndex - currentIndex)
+
+        # Look at the closest positions first, so that the first match
+        # of each length is the closest one.
         bestLength = 0
+        chainEnd = -1
+        if maxChain is not None:
+            chainEnd = max(len(positions) - 1 - maxChain, -1)
+        for i in range(len(positions) - 1, chainEnd, -1):
+            source = positions[i]
+            distance = currentIndex - source
+            if distance > distanceLimit:
+                break
 
-        # Compare what's coming up to what we've most recently seen.
-        searchLimit = min(
-            currentIndex,
-            (1 << sourceArgSize) - 1
-        )
-        for i in range(1, searchLimit):
-            # Don't look too far ahead at what's coming up:
-            # - No further than can be encoded in one command.
-            # - Not past the end of the input.
-            lookaheadLimit = min(
-                (1 << lengthArgSize) - 1 + 3,
-                endIndex - currentIndex
-            )
-
-            # Count how many sequential bytes match (possibly zero).
-            currentLength = 0
-            for j in range(lookaheadLimit):
-                if inBytes[currentIndex - i + j] == inBytes[currentIndex + j]:
-                    currentLength += 1
-                else:
-                    break
+            # A match can only be longer than the best one so far if the
+            # byte just past that matches too.
+            if bestLength > 0 and inBytes[source + bestLength] != inBytes[currentIndex + bestLength]:
+                continue
 
-            # Keep track of the largest match we've seen.
+            currentLength = matchLength(inBytes, source, currentIndex, lookaheadLimit)
             if currentLength > bestLength:
-                bestSource = i
                 bestLength = currentLength
+                matches.append((distance, bestLength))
+
+                # If we've found a maximum-possible-length match, break.
+                if bestLength == lookaheadLimit:
+                    break
+
+        positions.append(currentIndex)
+
+    return matchTable
+
+
+
+# Choose the longest pastcopy from a list of matches (see findMatches()),
+# no more than distanceLimit bytes back and lengthLimit bytes long. If
+# several are just as long, use the closest one. Returns the distance and
+# length, or (0, 0) if there's no pastcopy.
+def chooseMatch(matches, distanceLimit, lengthLimit):
+    bestLength = 0
+    for distance, length in matches:
+        if distance > distanceLimit:
+            break
+        bestLength = length
+    bestLength = min(bestLength, lengthLimit)
+
+    # The closest match that's at least that long.
+    for distance, length in matches:
+        if length >= bestLength > 0:
+            return (distance, bestLength)
+    return (0, 0)
 
-        # Write the next command.
+
+
+# Choose the commands for compressing the data with the given argument
+# sizes, always using the longest pastcopy possible. Returns a list of
+# (source, length) pairs, where a source of 0 means a literal byte.
+#
+# If bestSize (a shared multiprocessing.Value) is given, give up and return
+# None as soon as the compressed data is sure to be bigger than it.
+def parseGreedy(matchTable, sourceArgSize, lengthArgSize, bestSize=None):
+    commands = []
+    currentIndex = 0
+    endIndex = len(matchTable)
+
+    # How many bits the compressed data needs so far, counting the
+    # argument sizes and the terminating pastcopy.
+    pastcopyBitCount = 1 + sourceArgSize + lengthArgSize
+    bitCount = 8 + pastcopyBitCount
+
+    while currentIndex < endIndex:
+        # Compare what's coming up to what we've most recently seen.
+        # Don't look too far back, or too far ahead.
+        bestSource, bestLength = chooseMatch(
+            matchTable[currentIndex],
+            min(currentIndex - 1, maxDistance(sourceArgSize)),
+            min(maxLength(lengthArgSize), endIndex - currentIndex),
+        )
         if bestLength >= 3:
-            output += bitstring.pack("uint:1", BIT_PASTCOPY)
-            output += bitstring.pack(
-                "uint:n=v", n = sourceArgSize, v = bestSource
-            )
-            output += bitstring.pack(
-                "uint:n=v", n = lengthArgSize, v = bestLength - 3
-            )
+            commands.append((bestSource, bestLength))
             currentIndex += bestLength
+            bitCount += pastcopyBitCount
         else:
-            output += bitstring.pack("uint:1", BIT_LITERAL)
-            output += bitstring.pack("uint:8", inBytes[currentIndex])
+            commands.append((0, 1))
             currentIndex += 1
+            bitCount += 1 + 8
+
+        # Check whether another combination has already done better. (Only
+        # every so often: reading a shared value takes a lock.)
+        if bestSize is not None and len(commands) % BEST_SIZE_CHECK_INTERVAL == 0:
+            if bitCount > bestSize.value * 8:
+                return None
+
+    if bestSize is not None and bitCount > bestSize.value * 8:
+        return None
+    return commands
+
+
+
+# Work out the size of the compressed data for a list of commands,
+# without writing it.
+def compressedSize(commands, sourceArgSize, lengthArgSize):
+    pastcopyCount = sum(1 for source, length in commands if source != 0)
+    literalCount = len(commands) - pastcopyCount
+
+    # The argument sizes, the commands, and the terminating pastcopy.
+    bitCount = 8
+    bitCount += literalCount * (1 + 8)
+    bitCount += (pastcopyCount + 1) * (1 + sourceArgSize + lengthArgSize)
+    return (bitCount + 7) // 8
+
+
+
+# Write the compressed data for a list of commands.
+def encode(inBytes, commands, sourceArgSize, lengthArgSize):
+    currentIndex = 0
+    output = bitwriter.BitWriter()
+    output.write(sourceArgSize, 4)
+    output.write(lengthArgSize, 4)
+
+    # Write the commands.
+    for bestSource, bestLength in commands:
+        if bestSource != 0:
+            output.write(BIT_PASTCOPY, 1)
+            output.write(bestSource, sourceArgSize)
+            output.write(bestLength - 3, lengthArgSize)
+        else:
+            output.write(BIT_LITERAL, 1)
+            output.write(inBytes[currentIndex], 8)
+        currentIndex += bestLength
 
     # Write the terminating bits.
-    output += bitstring.pack("uint:1", BIT_PASTCOPY)
-    output += bitstring.pack("uint:n=v", n = sourceArgSize, v = 0)
-    output += bitstring.pack("uint:n=v", n = lengthArgSize, v = 0)
+    output.write(BIT_PASTCOPY, 1)
+    output.write(0, sourceArgSize)
+    output.write(0, lengthArgSize)
 
     # Return the compressed data.
     return output.tobytes()
 
 
 
+# If a match table for at least these argument sizes has already been
+# built, it can be passed in to save time. (See findMatches() for
+# maxChain.)
+def compress(inBytes, sourceArgSize, lengthArgSize, matchTable=None, maxChain=None):
+    if not 1 <= sourceArgSize <= MAX_ARG_SIZE or not 1 <= lengthArgSize <= MAX_ARG_SIZE:
+        raise ValueError("argument sizes must be 1 to {0:d}".format(MAX_ARG_SIZE))
+
+    if matchTable is None:
+        matchTable = findMatches(
+            inBytes, maxDistance(sourceArgSize), maxLength(lengthArgSize), maxChain
+        )
+    commands = parseGreedy(matchTable, sourceArgSize, lengthArgSize)
+    return encode(inBytes, commands, sourceArgSize, lengthArgSize)
+
+
+
+# Try every combination of argument sizes, and find the one that gives the
+# smallest output. (Only one match table is needed for all of them.) If
+# several are just as small, use the first. Returns the compressed data,
+# and a list of the (sourceArgSize, lengthArgSize, size) tried, in order.
+#
+# If report is given, it's called with each (sourceArgSize, lengthArgSize,
+# size) as soon as that combination is done. (See findMatches() for
+# maxChain.)
+def compressBest(inBytes, sourceArgSizes, lengthArgSizes, report=None, maxChain=None):
+    matchTable = findMatches(
+        inBytes,
+        maxDistance(max(sourceArgSizes)),
+        maxLength(max(lengthArgSizes)),
+        maxChain,
+    )
+
+    results = []
+    bestCommands = None
+    for sourceArgSize in sourceArgSizes:
+        for lengthArgSize in lengthArgSizes:
+            commands = parseGreedy(matchTable, sourceArgSize, lengthArgSize)
+            size = compressedSize(commands, sourceArgSize, lengthArgSize)
+            results.append((sourceArgSize, lengthArgSize, size))
+            if report is not None:
+                report(sourceArgSize, lengthArgSize, size)
+            if bestCommands is None or size < bestSize:
+                bestCommands = commands
+                bestSize = size
+                bestArgSizes = (sourceArgSize, lengthArgSize)
+
+    return (encode(inBytes, bestCommands, *bestArgSizes), results)
+
+
+
+# The match table and best size so far, in each process of a parallel
+# sweep. (They're set up once per process, not sent with every job.)
+sweepMatchTable = None
+sweepBestSize = None
+
+def initSweep(matchTable, bestSize):
+    global sweepMatchTable, sweepBestSize
+    sweepMatchTable = matchTable
+    sweepBestSize = bestSize
+
+
+
+# Price one combination of argument sizes, in a parallel sweep. Returns
+# the size of the compressed data, or None if another combination has
+# already done better.
+def sweepCombination(sourceArgSize, lengthArgSize):
+    commands = parseGreedy(sweepMatchTable, sourceArgSize, lengthArgSize, sweepBestSize)
+    if commands is None:
+        return None
+    size = compressedSize(commands, sourceArgSize, lengthArgSize)
+
+    # Let the other processes know, if this is the best so far.
+    with sweepBestSize.get_lock():
+        if size < sweepBestSize.value:
+            sweepBestSize.value = size
+    return size
+
+
+
+# Like compressBest(), but spread the combinations across jobCount
+# processes. The results are listed (and reported) in the order they
+# finish. A combination is abandoned as soon as it's sure to be bigger
+# than the best one done so far, in which case its size is None. The
+# output is the same as compressBest()'s.
+def compressBestParallel(
+    inBytes, sourceArgSizes, lengthArgSizes, jobCount, report=None, maxChain=None
+):
+    matchTable = findMatches(
+        inBytes,
+        maxDistance(max(sourceArgSizes)),
+        maxLength(max(lengthArgSizes)),
+        maxChain,
+    )
+    combinations = [
+        (sourceArgSize, lengthArgSize)
+        for sourceArgSize in sourceArgSizes
+        for lengthArgSize in lengthArgSizes
+    ]
+
+    # Combinations are only abandoned if they're strictly bigger than the
+    # best, so ties are never lost, and the first one can still be chosen.
+    bestSize = multiprocessing.Value("q", sys.maxsize)
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobCount, initializer=initSweep, initargs=(matchTable, bestSize)
+    ) as executor:
+        futures = {
+            executor.submit(sweepCombination, *combination): combination
+            for combination in combinations
+        }
+        for future in concurrent.futures.as_completed(futures):
+            sourceArgSize, lengthArgSize = futures[future]
+            size = future.result()
+            results.append((sourceArgSize, lengthArgSize, size))
+            if report is not None:
+                report(sourceArgSize, lengthArgSize, size)
+
+    # Choose the first of the smallest, and write it.
+    sizes = {
+        (sourceArgSize, lengthArgSize): size
+        for sourceArgSize, lengthArgSize, size in results
+        if size is not None
+    }
+    bestArgSizes = min(combinations, key=lambda combination: sizes.get(combination, sys.maxsize))
+    commands = parseGreedy(matchTable, *bestArgSizes)
+    return (encode(inBytes, commands, *bestArgSizes), results)
+
+
+
+# Print the result for one combination of argument sizes.
+def printResult(sourceArgSize, lengthArgSize, size):
+    if size is None:
+        print("Compressing: {0:d},{1:d} = abandoned".format(sourceArgSize, lengthArgSize))
+    else:
+        print("Compressing: {0:d},{1:d} = {2:d} bytes".format(
+            sourceArgSize, lengthArgSize, size
+        ))
+
+
+
 # Open a file for reading and writing. If the file doesn't exist, create it.
 # (Vanilla open() with mode "r+" raises an error if the file doesn't exist.)
 def touchopen(filename, *args, **kwargs):
@@ -94,41 +382,50 @@ def touchopen(filename, *args, **kwargs):
 
 if __name__ == "__main__":
 
+    # Check for the optional "--jobs N" and "--max-chain N".
+    args = sys.argv[1:]
+    options = {}
+    badOption = False
+    for option in ("--jobs", "--max-chain"):
+        if option in args:
+            i = args.index(option)
+            if i + 1 < len(args) and args[i + 1].isdigit() and int(args[i + 1]) > 0:
+                options[option] = int(args[i + 1])
+            else:
+                badOption = True
+            del args[i:i + 2]
+    jobCount = options.get("--jobs")
+    maxChain = options.get("--max-chain")
+
     # Check for incorrect usage.
-    argc = len(sys.argv)
-    if argc < 2 or argc > 4:
-        print("Usage: {0:s} <inFile> [outFile] [outOffset]".format(
+    argc = len(args) + 1
+    if argc < 2 or argc > 4 or badOption:
+        print("Usage: {0:s} [--jobs N] [--max-chain N] <inFile> [outFile] [outOffset]".format(
             sys.argv[0]
         ))
         sys.exit(1)
 
     # Copy the arguments.
-    inFile = sys.argv[1]
+    inFile = args[0]
     outFile = None
     if argc == 3 or argc == 4:
-        outFile = sys.argv[2]
+        outFile = args[1]
     outOffset = 0
     if argc == 4:
-        outOffset = int(sys.argv[3], 16)
+        outOffset = int(args[2], 16)
 
     # Read the input file.
     with open(inFile, "rb") as inStream:
         inBytes = bytearray(inStream.read())
 
-    # Compress the data.
-    compressedOptions = []
-    for sourceArgSize in range(10, 12):
-        for lengthArgSize in range(3, 6):
-            print(
-                "Compressing: {0:d},{1:d}".format(
-                    sourceArgSize, lengthArgSize
-                ),
-                end=""
-            )
-            thisOption = compress(inBytes, sourceArgSize, lengthArgSize)
-            print(" = {0:d} bytes".format(len(thisOption)))
-            compressedOptions.append(thisOption)
-    outBytes = min(compressedOptions, key=len)
+    # Compress the data, with every possible combination of argument sizes.
+    argSizes = range(1, MAX_ARG_SIZE + 1)
+    if jobCount is None:
+        outBytes, results = compressBest(inBytes, argSizes, argSizes, printResult, maxChain)
+    else:
+        outBytes, results = compressBestParallel(
+            inBytes, argSizes, argSizes, jobCount, printResult, maxChain
+        )
     print("Done.")
     print()
 
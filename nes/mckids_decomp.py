@@ -31,52 +31,68 @@
 #
 #   - Literal is exactly what it says on the tin. The N argument
 #     is one uncompressed byte.
-#
-# This code uses python-bitstring:
-# https://pypi.org/project/bitstring/
 
 import sys
-import bitstring
+import bitreader
 
 
 
-def decompress(inBytes, startOffset=0):
-    # Define some useful constants.
-    BIT_PASTCOPY = 0
-    BIT_LITERAL = 1
+# Define some useful constants.
+BIT_PASTCOPY = 0
+BIT_LITERAL = 1
+
+
+
+# Read one of pastcopy's arguments. (An argument size of 0 isn't valid.)
+def readArgument(inStream, argSize):
+    if argSize == 0:
+        raise ValueError("pastcopy argument size of zero")
+    return inStream.read(argSize)
 
+
+
+def decompress(inBytes, startOffset=0):
     # Prepare to read the compressed bytes.
-    inStream = bitstring.ConstBitStream(bytes=inBytes)
-    inStream.bytepos = startOffset
+    inStream = bitreader.BitReader(inBytes, startOffset)
 
     # Allocate storage for the decompressed output.
     decomp = bytearray()
 
     # Read the first byte.
     # (It specifies the size of pastcopy's two arguments.)
-    copySourceSize = inStream.read("uint:4")
-    copyLengthSize = inStream.read("uint:4")
+    copySourceSize = inStream.read(4)
+    copyLengthSize = inStream.read(4)
 
     # Main decompression loop.
     while True:
-        nextCommand = inStream.read("uint:1")
+        nextCommand = inStream.read(1)
 
         if nextCommand == BIT_PASTCOPY:
             # 0: Pastcopy case.
-            copySource = inStream.read(copySourceSize).uint
-            copyLength = inStream.read(copyLengthSize).uint
+            copySource = readArgument(inStream, copySourceSize)
+            copyLength = readArgument(inStream, copyLengthSize)
             copyLength += 3
 
             # A copy source of 0 indicates the end.
             if copySource == 0:
                 break
 
-            for i in range(copyLength):
-                decomp.append(decomp[-copySource])
+            if copySource > len(decomp):
+                raise IndexError("copy source before the start of the output")
+
+            # The copy may overlap the bytes it's writing. If so, the
+            # bytes from the source onward repeat every copySource bytes,
+            # so copy everything from the source to the end each time,
+            # which doubles it.
+            pastIndex = len(decomp) - copySource
+            while copyLength > 0:
+                pastBytes = decomp[pastIndex:pastIndex + copyLength]
+                decomp += pastBytes
+                copyLength -= len(pastBytes)
 
         elif nextCommand == BIT_LITERAL:
             # 1: Literal case.
-            literalByte = inStream.read("uint:8")
+            literalByte = inStream.read(8)
             decomp.append(literalByte)
 
     # Calculate the end offset.
@@ -88,6 +104,49 @@ def decompress(inBytes, startOffset=0):
 
 
 
+# Like decompress(), but only work out the size of the decompressed data.
+# Nothing is decompressed: the commands are read, and literal bytes are
+# skipped over.
+def measure(inBytes, startOffset=0):
+    # Prepare to read the compressed bytes.
+    inStream = bitreader.BitReader(inBytes, startOffset)
+    decompSize = 0
+
+    # Read the first byte.
+    # (It specifies the size of pastcopy's two arguments.)
+    copySourceSize = inStream.read(4)
+    copyLengthSize = inStream.read(4)
+
+    # Main measuring loop.
+    while True:
+        nextCommand = inStream.read(1)
+
+        if nextCommand == BIT_PASTCOPY:
+            # 0: Pastcopy case.
+            copySource = readArgument(inStream, copySourceSize)
+            copyLength = readArgument(inStream, copyLengthSize)
+            copyLength += 3
+
+            # A copy source of 0 indicates the end.
+            if copySource == 0:
+                break
+
+            decompSize += copyLength
+
+        elif nextCommand == BIT_LITERAL:
+            # 1: Literal case.
+            inStream.read(8)
+            decompSize += 1
+
+    # Calculate the end offset.
+    inStream.bytealign()
+    endOffset = inStream.bytepos
+
+    # Return the decompressed size and end offset.
+    return (decompSize, endOffset)
+
+
+
 if __name__ == "__main__":
 
     # Check for incorrect usage.
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+#
+# Bit Reader
+# Osteoclave
+# 2026-10-18
+#
+# Reads values of any bit width, most significant bit first, from a
+# bytes-like object. A faster replacement for reading compressed data with
+# bitstring: the bits are kept in an int, which is refilled a byte at a
+# time, and exponential-Golomb codes are read eight bits at a time with a
+# lookup table.
+#
+# There's a cut-down copy of this in nes/bitreader.py.
+
+
+
+# How many bits the exponential-Golomb table looks at once.
+UIE_TABLE_BITS = 8
+
+# What every window of UIE_TABLE_BITS bits means, as the start of an
+# interleaved exponential-Golomb code (see BitWriter.write_uie()). The
+# bits alternate between a flag (1 to stop, 0 to keep going) and a data
+# bit. Each entry is (bits used, data bit count, data bits, stopped).
+def buildUieTable():
+    table = []
+    for window in range(1 << UIE_TABLE_BITS):
+        bitsUsed = 0
+        dataCount = 0
+        dataBits = 0
+        stopped = False
+        while bitsUsed < UIE_TABLE_BITS:
+            flag = (window >> (UIE_TABLE_BITS - 1 - bitsUsed)) & 1
+            bitsUsed += 1
+            if flag == 1:
+                stopped = True
+                break
+            # A window always ends on a flag, so the data bit is there.
+            dataBit = (window >> (UIE_TABLE_BITS - 1 - bitsUsed)) & 1
+            bitsUsed += 1
+            dataBits = (dataBits << 1) | dataBit
+            dataCount += 1
+        table.append((bitsUsed, dataCount, dataBits, stopped))
+    return table
+
+UIE_TABLE = buildUieTable()
+
+
+
+class BitReader:
+
+    def __init__(self, inBytes, startOffset=0):
+        self.inBytes = inBytes
+        self.inPos = startOffset
+        # The bits that have been read from the input, but not used yet.
+        self.bits = 0
+        self.bitCount = 0
+
+
+
+    # Read a value nbits bits long.
+    def read(self, nbits):
+        while self.bitCount < nbits:
+            self.bits = (self.bits << 8) | self.inBytes[self.inPos]
+            self.inPos += 1
+            self.bitCount += 8
+
+        self.bitCount -= nbits
+        value = self.bits >> self.bitCount
+        self.bits &= (1 << self.bitCount) - 1
+        return value
+
+
+
+    # Read an interleaved exponential-Golomb code (the same as bitstring's
+    # "uie"), and return its value.
+    def read_uie(self):
+        value = 1
+        while True:
+            # Look at the next few bits. (Near the end of the input, there
+            # might not be enough: pretend the rest are zeros, and check
+            # that the code doesn't use them.)
+            while self.bitCount < UIE_TABLE_BITS and self.inPos < len(self.inBytes):
+                self.bits = (self.bits << 8) | self.inBytes[self.inPos]
+                self.inPos += 1
+                self.bitCount += 8
+            shift = self.bitCount - UIE_TABLE_BITS
+            if shift >= 0:
+                window = self.bits >> shift
+            else:
+                window = self.bits << -shift
+
+            bitsUsed, dataCount, dataBits, stopped = UIE_TABLE[window]
+            if bitsUsed > self.bitCount:
+                raise IndexError("exponential-Golomb code past the end of the input")
+            self.bitCount -= bitsUsed
+            self.bits &= (1 << self.bitCount) - 1
+            value = (value << dataCount) | dataBits
+            if stopped:
+                return value - 1
+
+
+
+    # Skip to the start of the next byte (unless already there).
+    def bytealign(self):
+        self.bitCount -= self.bitCount % 8
+        self.bits &= (1 << self.bitCount) - 1
+
+
+
+    # The position of the next byte to be read. (Only meaningful when
+    # byte-aligned.)
+    @property
+    def bytepos(self):
+        return self.inPos - self.bitCount // 8
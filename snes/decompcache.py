@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+#
+# Decompression Cache
+# Osteoclave
+# 2026-10-18
+#
+# Keeps decompressed data on disk, so that decompressing the same data
+# again only needs a file read.
+#
+# Decompressed data only depends on the compressed bytes it came from, so
+# each entry is keyed by the decompressor (codec), the start offset, and
+# the size and hash of the compressed bytes. An entry is only used if the
+# bytes at that offset still hash the same: if they've been edited, the
+# data is decompressed again (and cached again). Edits anywhere else don't
+# matter. Entries are stored as one file each:
+#
+#   <codec>_<startOffset>_<compressedSize>_<hash>.bin
+#
+# The cache is kept under a maximum size by deleting the least recently
+# used entries. (Using an entry updates its modification time.)
+
+import hashlib
+import os
+
+
+
+# Where the cache goes if no directory is given.
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"),
+    "game-tools",
+)
+
+# How big the cache can get, in bytes.
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+
+# Hash some compressed bytes, for checking that they haven't changed.
+def hashBytes(inBytes, startOffset, endOffset):
+    return hashlib.sha1(inBytes[startOffset:endOffset]).hexdigest()
+
+
+
+# Delete the least recently used entries until the cache is small enough.
+def evict(cacheDir, maxSize):
+    entries = []
+    with os.scandir(cacheDir) as cacheEntries:
+        for entry in cacheEntries:
+            if entry.name.endswith(".bin"):
+                try:
+                    entryStat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entryStat.st_mtime, entryStat.st_size, entry.path))
+
+    totalSize = sum(entrySize for _, entrySize, _ in entries)
+    for _, entrySize, entryPath in sorted(entries):
+        if totalSize <= maxSize:
+            break
+        # Another process might have deleted it already.
+        try:
+            os.remove(entryPath)
+        except FileNotFoundError:
+            pass
+        totalSize -= entrySize
+
+
+
+# Decompress data with a decompressor module's decompress(), unless it's
+# already in the cache. Returns the same (decompressed data, end offset)
+# as decompress() does.
+def decompress(codec, inBytes, startOffset, cacheDir=DEFAULT_CACHE_DIR, maxSize=DEFAULT_MAX_SIZE):
+    codecName = codec.__name__
+    prefix = "{0:s}_{1:06X}_".format(codecName, startOffset)
+    os.makedirs(cacheDir, exist_ok=True)
+
+    # Look for an entry whose compressed bytes match what's there now.
+    for entryName in os.listdir(cacheDir):
+        if not entryName.startswith(prefix) or not entryName.endswith(".bin"):
+            continue
+        compSize, entryHash = entryName[len(prefix):-len(".bin")].split("_")
+        endOffset = startOffset + int(compSize, 16)
+        if endOffset > len(inBytes) or hashBytes(inBytes, startOffset, endOffset) != entryHash:
+            continue
+
+        entryPath = os.path.join(cacheDir, entryName)
+        try:
+            with open(entryPath, "rb") as entryStream:
+                outBytes = bytearray(entryStream.read())
+            os.utime(entryPath)
+        except FileNotFoundError:
+            # It was evicted by another process.
+            continue
+        return (outBytes, endOffset)
+
+    # It's not cached, so decompress it.
+    outBytes, endOffset = codec.decompress(inBytes, startOffset)
+
+    # Add it to the cache. (Write to a temporary file first, so another
+    # process never sees a partly-written entry.)
+    entryName = "{0:s}{1:X}_{2:s}.bin".format(
+        prefix,
+        endOffset - startOffset,
+        hashBytes(inBytes, startOffset, endOffset),
+    )
+    entryPath = os.path.join(cacheDir, entryName)
+    tempPath = "{0:s}.{1:d}.tmp".format(entryPath, os.getpid())
+    with open(tempPath, "wb") as tempStream:
+        tempStream.write(outBytes)
+    os.replace(tempPath, entryPath)
+    evict(cacheDir, maxSize)
+
+    return (outBytes, endOffset)
@@ -8,191 +8,124 @@
 
 import os
 import sys
-
-
-
-# Reverse the bits of a byte (e.g. 0x80 <---> 0x01).
-def reverseByte(currentByte):
-    currentByte = ((currentByte >> 4) & 0x0F) | ((currentByte << 4) & 0xF0)
-    currentByte = ((currentByte >> 2) & 0x33) | ((currentByte << 2) & 0xCC)
-    currentByte = ((currentByte >> 1) & 0x55) | ((currentByte << 1) & 0xAA)
-    return currentByte
+import earthbound_decomp
+import sizewindow
+import suffixarray
 
 
 
 # Command 1: Run of a constant byte
-def lookForConstantByte(inBuffer, currentIndex):
-    # Don't look past the end of the buffer.
-    compareLimit = len(inBuffer) - currentIndex
+def findConstantBytes(inBuffer):
+    runLengths = [0] * len(inBuffer)
 
+    # Work backward from the end of the buffer, so the run starting at
+    # each position is one longer than the run starting after it.
     # Don't look too far ahead.
-    if compareLimit > 1024:
-        compareLimit = 1024
-
-    nextByte = inBuffer[currentIndex]
-    matchLength = 0
-
-    for i in range(compareLimit):
-        if inBuffer[currentIndex + i] == nextByte:
-            matchLength += 1
+    nextLength = 0
+    nextByte = None
+    for i in range(len(inBuffer) - 1, -1, -1):
+        if inBuffer[i] == nextByte:
+            nextLength = min(nextLength + 1, 1024)
         else:
-            break
+            nextLength = 1
+        nextByte = inBuffer[i]
+        runLengths[i] = nextLength
 
-    return matchLength, nextByte
+    return runLengths
 
 
 
 # Command 2: Run of a constant word
-def lookForConstantWord(inBuffer, currentIndex):
-    # Don't look past the end of the buffer.
-    compareLimit = len(inBuffer) - currentIndex
-    if (compareLimit % 2) == 1:
-        compareLimit -= 1
+def findConstantWords(inBuffer):
+    runLengths = [0] * len(inBuffer)
 
+    # Like findConstantBytes(), except a word is compared to the word
+    # after it, two bytes later. (The last byte can't start a word.)
     # Don't look too far ahead.
-    if compareLimit > 2048:
-        compareLimit = 2048
-
-    # We need at least one word remaining to continue.
-    if compareLimit < 2:
-        return 0, None
-
-    nextWord = inBuffer[currentIndex+0]
-    nextWord += (inBuffer[currentIndex+1] << 8)
-    matchLength = 0
-
-    for i in range(0, compareLimit, 2):
-        currentWord = inBuffer[currentIndex + i + 0]
-        currentWord += (inBuffer[currentIndex + i + 1] << 8)
-        if currentWord == nextWord:
-            matchLength += 2
+    for i in range(len(inBuffer) - 2, -1, -1):
+        if (
+            i + 3 < len(inBuffer)
+            and inBuffer[i + 0] == inBuffer[i + 2]
+            and inBuffer[i + 1] == inBuffer[i + 3]
+        ):
+            runLengths[i] = min(runLengths[i + 2] + 2, 2048)
         else:
-            break
+            runLengths[i] = 2
 
-    return matchLength, nextWord
+    return runLengths
 
 
 
 # Command 3: Run of incrementing bytes
-def lookForIncrementingByte(inBuffer, currentIndex):
-    # Don't look past the end of the buffer.
-    compareLimit = len(inBuffer) - currentIndex
-
-    # Don't look too far ahead.
-    if compareLimit > 1024:
-        compareLimit = 1024
-
-    nextByte = inBuffer[currentIndex]
-    matchLength = 0
-
-    for i in range(compareLimit):
-        if inBuffer[currentIndex + i] == ((nextByte + i) & 0xFF):
-            matchLength += 1
+def findIncrementingBytes(inBuffer):
+    runLengths = [0] * len(inBuffer)
+
+    # Like findConstantBytes(), except each byte must be one less than
+    # the byte after it. Don't look too far ahead.
+    nextLength = 0
+    nextByte = None
+    for i in range(len(inBuffer) - 1, -1, -1):
+        if ((inBuffer[i] + 1) & 0xFF) == nextByte:
+            nextLength = min(nextLength + 1, 1024)
         else:
-            break
-
-    return matchLength, nextByte
-
-
-
-# Command 4: Copy past bytes
-def lookForPastBytesForward(inBuffer, currentIndex):
-    bestIndex = 0
-    bestLength = 0
-
-    # Don't look past the end of the buffer.
-    compareLimit = len(inBuffer) - currentIndex
-
-    # Don't look too far ahead.
-    if compareLimit > 1024:
-        compareLimit = 1024
-
-    for i in range(currentIndex):
-        # Count how many sequential bytes match (possibly zero).
-        currentLength = 0
-        for j in range(compareLimit):
-            if inBuffer[i + j] == inBuffer[currentIndex + j]:
-                currentLength += 1
-            else:
-                break
-
-        # Keep track of the largest match we've seen.
-        if currentLength > bestLength:
-            bestIndex = i
-            bestLength = currentLength
-
-    return bestLength, bestIndex
-
-
-
-# Command 5: Copy past bytes (with bits in reverse order)
-def lookForPastBytesBitReversed(inBuffer, inBufferBitReversed, currentIndex):
-    bestIndex = 0
-    bestLength = 0
-
-    # Don't look past the end of the buffer.
-    compareLimit = len(inBufferBitReversed) - currentIndex
-
-    # Don't look too far ahead.
-    if compareLimit > 1024:
-        compareLimit = 1024
-
-    for i in range(currentIndex):
-        # Count how many sequential bytes match (possibly zero).
-        currentLength = 0
-        for j in range(compareLimit):
-            if inBufferBitReversed[i + j] == inBuffer[currentIndex + j]:
-                currentLength += 1
-            else:
-                break
-
-        # Keep track of the largest match we've seen.
-        if currentLength > bestLength:
-            bestIndex = i
-            bestLength = currentLength
-
-    return bestLength, bestIndex
-
-
-
-# Command 6: Copy past bytes (backward)
-def lookForPastBytesBackward(inBuffer, currentIndex):
-    bestIndex = 0
-    bestLength = 0
-
-    # Don't look past the end of the buffer.
-    initialCompareLimit = len(inBuffer) - currentIndex
-
-    # Don't look too far ahead.
-    if initialCompareLimit > 1024:
-        initialCompareLimit = 1024
-
-    for i in range(currentIndex):
-        # Don't look too far back.
-        compareLimit = initialCompareLimit
-        if compareLimit > i:
-            compareLimit = i
-
-        # Count how many sequential bytes match (possibly zero).
-        currentLength = 0
-        for j in range(compareLimit):
-            if inBuffer[i - j] == inBuffer[currentIndex + j]:
-                currentLength += 1
-            else:
-                break
-
-        # Keep track of the largest match we've seen.
-        if currentLength > bestLength:
-            bestIndex = i
-            bestLength = currentLength
+            nextLength = 1
+        nextByte = inBuffer[i]
+        runLengths[i] = nextLength
 
-    return bestLength, bestIndex
+    return runLengths
 
 
 
-# Turn a command number, count and argument into compressed data.
-def encodeCommand(command, count, argument):
-    encodedResult = bytearray()
+# Commands 4, 5 and 6: Copy past bytes (forward, with bits in reverse
+# order, and backward)
+#
+# The buffer, the buffer with its bits reversed, and the buffer reversed
+# are sorted together as separate strings (see suffixarray.py), and each
+# command looks for pastcopies from its own string. Returns a (lengths,
+# sources) pair of lists for each command, with the length of the longest
+# pastcopy at every position, and one earlier position it can copy from.
+#
+# This is most of the time compress() takes, and it's slow: for 64 KB of
+# data, about 1.5 to 2.5 seconds in all, depending on the data. (Sorting
+# takes about a third of it, and the searches most of the rest. Doing all
+# three searches in one pass over the sorted suffixes isn't any faster.)
+def findPastBytes(inBuffer, inBufferBitReversed, inBufferReversed):
+    n = len(inBuffer)
+
+    # A backward copy from position i reads the buffer from i down to 0,
+    # which is the reversed buffer from position (n - 1 - i) onward. (The
+    # brute-force search never copied from position 0 itself, and we keep
+    # it that way, so the last byte of the reversed buffer is left out.)
+    allBytes = bytes(inBuffer) + bytes(inBufferBitReversed) + bytes(inBufferReversed[:-1])
+    boundaries = (n, 2 * n)
+    suffixArray = suffixarray.buildSuffixArray(allBytes, boundaries)
+    lcpArray = suffixarray.buildLcpArray(allBytes, suffixArray, boundaries)
+
+    # The position each suffix would be copied from, for each command.
+    positions = list(range(n))
+    noPositions = [None] * n
+    forwardPositions = positions + noPositions + noPositions[1:]
+    bitReversedPositions = noPositions + positions + noPositions[1:]
+    backwardPositions = noPositions + noPositions + positions[:0:-1]
+
+    tables = []
+    for sourcePositions in (forwardPositions, bitReversedPositions, backwardPositions):
+        matchLengths, matchSources = suffixarray.findMatches(
+            suffixArray, lcpArray, n, sourcePositions
+        )
+
+        # Don't look too far ahead.
+        matchLengths = [min(x, 1024) for x in matchLengths]
+        tables.append((matchLengths, matchSources))
+
+    return tables
+
+
+
+# Turn a command number, count and argument into compressed data, and
+# write it to the end of the output. Returns the number of bytes written.
+def encodeCommand(output, command, count, argument):
+    startLength = len(output)
 
     # Command 2 (run of a constant word) uses a count of words
     # instead of a count of bytes.
@@ -201,41 +134,53 @@ def encodeCommand(command, count, argument):
 
     count -= 1
     if count < 32:
-        encodedResult.append((command << 5) + count)
+        output.append((command << 5) + count)
     else:
-        encodedResult.append((7 << 5) + (command << 2) + (count >> 8))
-        encodedResult.append(count & 0xFF)
+        output.append((7 << 5) + (command << 2) + (count >> 8))
+        output.append(count & 0xFF)
 
     if command == 0:
-        # Use extend() instead of append().
-        encodedResult.extend(argument)
+        # Use extend() instead of append(). (The argument can be any
+        # bytes-like object, such as a memoryview of the input.)
+        output.extend(argument)
     elif command == 1:
-        encodedResult.append(argument & 0xFF)
+        output.append(argument & 0xFF)
     elif command == 2:
-        encodedResult.append(argument & 0xFF)
-        encodedResult.append((argument & 0xFF00) >> 8)
+        output.append(argument & 0xFF)
+        output.append((argument & 0xFF00) >> 8)
     elif command == 3:
-        encodedResult.append(argument & 0xFF)
+        output.append(argument & 0xFF)
     else:
-        encodedResult.append((argument & 0xFF00) >> 8)
-        encodedResult.append(argument & 0xFF)
+        output.append((argument & 0xFF00) >> 8)
+        output.append(argument & 0xFF)
 
-    return encodedResult
+    return len(output) - startLength
 
 
 
-def compress(inBytes):
-    # Prepare for compression.
-    inBuffer = bytearray(inBytes)
-    output = bytearray()
+# Choose commands by looking at the upcoming bytes, and using whichever
+# command compresses the most of them for its size. The tables have the
+# longest run or pastcopy of each command (1-6) for every position.
+#
+# Returns a list of (command, count, argument) tuples. For literals, the
+# argument is the position of the first literal byte; for pastcopies, it
+# is one source position (from the tables) that works.
+def parseGreedy(inBuffer, lengthTables, sourceTables):
+    # Prepare for parsing.
+    commands = []
     currentIndex = 0
-    queuedLiterals = bytearray()
-
-    # Create a copy of the buffer where the bits of every byte are
-    # reversed (e.g. 0x80 <---> 0x01).
-    inBufferBitReversed = bytearray([reverseByte(x) for x in inBuffer])
-
-    # Main compression loop.
+    queuedLiterals = 0
+    (
+        constantByteLengths,
+        constantWordLengths,
+        incrementingByteLengths,
+        forwardLengths,
+        bitReversedLengths,
+        backwardLengths,
+    ) = lengthTables[1:]
+    forwardSources, bitReversedSources, backwardSources = sourceTables[4:]
+
+    # Main parsing loop.
     while currentIndex < len(inBuffer):
         bestCommand = 0
         bestLength = 0
@@ -248,7 +193,8 @@ def compress(inBytes):
 
         # Find the command that will compress the most upcoming bytes.
         # Command 1: Run of a constant byte
-        candidateLength, candidateArgument = lookForConstantByte(inBuffer, currentIndex)
+        candidateLength = constantByteLengths[currentIndex]
+        candidateArgument = inBuffer[currentIndex]
         if candidateLength >= 32:
             candidateRatio = candidateLength / 3
         else:
@@ -260,7 +206,10 @@ def compress(inBytes):
             bestRatio = candidateRatio
 
         # Command 2: Run of a constant word
-        candidateLength, candidateArgument = lookForConstantWord(inBuffer, currentIndex)
+        candidateLength = constantWordLengths[currentIndex]
+        candidateArgument = inBuffer[currentIndex]
+        if candidateLength > 0:
+            candidateArgument += (inBuffer[currentIndex + 1] << 8)
         if candidateLength >= 64:
             candidateRatio = candidateLength / 4
         else:
@@ -272,7 +221,8 @@ def compress(inBytes):
             bestRatio = candidateRatio
 
         # Command 3: Run of incrementing bytes
-        candidateLength, candidateArgument = lookForIncrementingByte(inBuffer, currentIndex)
+        candidateLength = incrementingByteLengths[currentIndex]
+        candidateArgument = inBuffer[currentIndex]
         if candidateLength >= 32:
             candidateRatio = candidateLength / 3
         else:
@@ -284,7 +234,8 @@ def compress(inBytes):
             bestRatio = candidateRatio
 
         # Command 4: Copy past bytes
-        candidateLength, candidateArgument = lookForPastBytesForward(inBuffer, currentIndex)
+        candidateLength = forwardLengths[currentIndex]
+        candidateArgument = forwardSources[currentIndex]
         if candidateLength >= 32:
             candidateRatio = candidateLength / 4
         else:
@@ -296,7 +247,8 @@ def compress(inBytes):
             bestRatio = candidateRatio
 
         # Command 5: Copy past bytes (with bits in reverse order)
-        candidateLength, candidateArgument = lookForPastBytesBitReversed(inBuffer, inBufferBitReversed, currentIndex)
+        candidateLength = bitReversedLengths[currentIndex]
+        candidateArgument = bitReversedSources[currentIndex]
         if candidateLength >= 32:
             candidateRatio = candidateLength / 4
         else:
@@ -308,7 +260,8 @@ def compress(inBytes):
             bestRatio = candidateRatio
 
         # Command 6: Copy past bytes (backward)
-        candidateLength, candidateArgument = lookForPastBytesBackward(inBuffer, currentIndex)
+        candidateLength = backwardLengths[currentIndex]
+        candidateArgument = backwardSources[currentIndex]
         if candidateLength >= 32:
             candidateRatio = candidateLength / 4
         else:
@@ -325,30 +278,315 @@ def compress(inBytes):
         # encoded as several one-byte commands instead of a single
         # multi-byte command.)
         if bestCommand == 0:
-            queuedLiterals.append(inBuffer[currentIndex])
+            queuedLiterals += 1
             currentIndex += 1
             # If we have 1024 literals queued up, output them.
             # (That's the most we can write with one command.)
-            if len(queuedLiterals) == 1024:
-                output += encodeCommand(0, len(queuedLiterals), queuedLiterals)
-                queuedLiterals = bytearray()
+            if queuedLiterals == 1024:
+                commands.append((0, queuedLiterals, currentIndex - queuedLiterals))
+                queuedLiterals = 0
             continue
 
         # If we've reached this point, we have a non-literal command
         # to output. If we have any literals queued, output them now.
-        if len(queuedLiterals) > 0:
-            output += encodeCommand(0, len(queuedLiterals), queuedLiterals)
-            queuedLiterals = bytearray()
+        if queuedLiterals > 0:
+            commands.append((0, queuedLiterals, currentIndex - queuedLiterals))
+            queuedLiterals = 0
 
         # Output the non-literal command.
-        output += encodeCommand(bestCommand, bestLength, bestArgument)
+        commands.append((bestCommand, bestLength, bestArgument))
 
         # Advance the current position in the buffer.
         currentIndex += bestLength
 
     # Output any leftover queued literals.
-    if len(queuedLiterals) > 0:
-        output += encodeCommand(0, len(queuedLiterals), queuedLiterals)
+    if queuedLiterals > 0:
+        commands.append((0, queuedLiterals, currentIndex - queuedLiterals))
+
+    return commands
+
+
+
+# Choose commands by finding the smallest possible output. Work backward
+# from the end of the buffer: the best output from each position is the
+# smallest of (size of a command from here) + (best output from where
+# that command ends), for every command and count that's possible.
+#
+# Commands with the same argument size cost the same, so only the one
+# that reaches furthest needs to be considered. And there are only two
+# sizes for each command (short or long count), so the best count for
+# each is the one that ends where the best output is smallest, which
+# the windows find quickly.
+#
+# Returns the same kind of list as parseGreedy().
+def parseOptimal(inBuffer, lengthTables, sourceTables):
+    # Prepare for parsing.
+    inLength = len(inBuffer)
+    bestSizes = [0] * (inLength + 1)
+    bestCommands = [0] * inLength
+    bestEnds = [0] * inLength
+    (
+        constantByteLengths,
+        constantWordLengths,
+        incrementingByteLengths,
+        forwardLengths,
+        bitReversedLengths,
+        backwardLengths,
+    ) = lengthTables[1:]
+
+    # Get the size of each command from encodeCommand(), for short counts
+    # (up to 32, which fit in the first byte) and long ones. Literals also
+    # take one byte per byte copied, which is counted separately.
+    scratch = bytearray()
+    literalSizes = (
+        encodeCommand(scratch, 0, 1, bytes(1)) - 1,
+        encodeCommand(scratch, 0, 33, bytes(33)) - 33,
+    )
+    byteRunSizes = (
+        encodeCommand(scratch, 1, 1, 0),
+        encodeCommand(scratch, 1, 33, 0),
+    )
+    wordRunSizes = (
+        encodeCommand(scratch, 2, 2, 0),
+        encodeCommand(scratch, 2, 66, 0),
+    )
+    pastcopySizes = (
+        encodeCommand(scratch, 4, 1, 0),
+        encodeCommand(scratch, 4, 33, 0),
+    )
+
+    # Windows over the best output sizes, for short and long counts.
+    # Literals use (position + size), so the number of literal bytes is
+    # taken into account. Word runs end an even number of bytes away, so
+    # they have a pair of windows for each parity. (A command is only
+    # looked up in a window once the position right after its shortest
+    # count has been added, so there's always something in range.)
+    shortSizes = ([], [])
+    longSizes = ([], [])
+    shortLiterals = ([], [])
+    longLiterals = ([], [])
+    shortWords = (([], []), ([], []))
+    longWords = (([], []), ([], []))
+
+    # Main parsing loop.
+    for currentIndex in range(inLength - 1, -1, -1):
+        remaining = inLength - currentIndex
+        parity = currentIndex % 2
+
+        # Add the newly-reachable positions to the windows.
+        nextIndex = currentIndex + 1
+        sizewindow.addToWindow(shortSizes, nextIndex, bestSizes[nextIndex])
+        sizewindow.addToWindow(shortLiterals, nextIndex, nextIndex + bestSizes[nextIndex])
+        if remaining >= 2:
+            nextIndex = currentIndex + 2
+            sizewindow.addToWindow(shortWords[parity], nextIndex, bestSizes[nextIndex])
+        if remaining >= 33:
+            nextIndex = currentIndex + 33
+            sizewindow.addToWindow(longSizes, nextIndex, bestSizes[nextIndex])
+            sizewindow.addToWindow(longLiterals, nextIndex, nextIndex + bestSizes[nextIndex])
+        if remaining >= 66:
+            nextIndex = currentIndex + 66
+            sizewindow.addToWindow(longWords[parity], nextIndex, bestSizes[nextIndex])
+
+        # Literal bytes (always possible)
+        candidateSize, candidateEnd = sizewindow.searchWindow(
+            shortLiterals, currentIndex + min(remaining, 32)
+        )
+        bestSize = candidateSize - currentIndex + literalSizes[0]
+        bestCommand = 0
+        bestEnd = candidateEnd
+        if remaining > 32:
+            candidateSize, candidateEnd = sizewindow.searchWindow(
+                longLiterals, currentIndex + min(remaining, 1024)
+            )
+            candidateSize += literalSizes[1] - currentIndex
+            if candidateSize < bestSize:
+                bestSize = candidateSize
+                bestEnd = candidateEnd
+
+        # Commands 1 and 3: Runs of bytes
+        candidateCommand = 1
+        candidateLength = constantByteLengths[currentIndex]
+        if incrementingByteLengths[currentIndex] > candidateLength:
+            candidateCommand = 3
+            candidateLength = incrementingByteLengths[currentIndex]
+        if candidateLength >= 2:
+            candidateSize, candidateEnd = sizewindow.searchWindow(
+                shortSizes, currentIndex + min(candidateLength, 32)
+            )
+            candidateSize += byteRunSizes[0]
+            if candidateSize < bestSize:
+                bestSize = candidateSize
+                bestCommand = candidateCommand
+                bestEnd = candidateEnd
+        if candidateLength > 32:
+            candidateSize, candidateEnd = sizewindow.searchWindow(
+                longSizes, currentIndex + candidateLength
+            )
+            candidateSize += byteRunSizes[1]
+            if candidateSize < bestSize:
+                bestSize = candidateSize
+                bestCommand = candidateCommand
+                bestEnd = candidateEnd
+
+        # Command 2: Run of a constant word
+        candidateLength = constantWordLengths[currentIndex]
+        if candidateLength >= 4:
+            candidateSize, candidateEnd = sizewindow.searchWindow(
+                shortWords[parity], currentIndex + min(candidateLength, 64)
+            )
+            candidateSize += wordRunSizes[0]
+            if candidateSize < bestSize:
+                bestSize = candidateSize
+                bestCommand = 2
+                bestEnd = candidateEnd
+        if candidateLength > 64:
+            candidateSize, candidateEnd = sizewindow.searchWindow(
+                longWords[parity], currentIndex + candidateLength
+            )
+            candidateSize += wordRunSizes[1]
+            if candidateSize < bestSize:
+                bestSize = candidateSize
+                bestCommand = 2
+                bestEnd = candidateEnd
+
+        # Commands 4, 5 and 6: Pastcopies
+        candidateCommand = 4
+        candidateLength = forwardLengths[currentIndex]
+        if bitReversedLengths[currentIndex] > candidateLength:
+            candidateCommand = 5
+            candidateLength = bitReversedLengths[currentIndex]
+        if backwardLengths[currentIndex] > candidateLength:
+            candidateCommand = 6
+            candidateLength = backwardLengths[currentIndex]
+        if candidateLength >= 3:
+            candidateSize, candidateEnd = sizewindow.searchWindow(
+                shortSizes, currentIndex + min(candidateLength, 32)
+            )
+            candidateSize += pastcopySizes[0]
+            if candidateSize < bestSize:
+                bestSize = candidateSize
+                bestCommand = candidateCommand
+                bestEnd = candidateEnd
+        if candidateLength > 32:
+            candidateSize, candidateEnd = sizewindow.searchWindow(
+                longSizes, currentIndex + candidateLength
+            )
+            candidateSize += pastcopySizes[1]
+            if candidateSize < bestSize:
+                bestSize = candidateSize
+                bestCommand = candidateCommand
+                bestEnd = candidateEnd
+
+        bestSizes[currentIndex] = bestSize
+        bestCommands[currentIndex] = bestCommand
+        bestEnds[currentIndex] = bestEnd
+
+    # Follow the best choices forward from the start of the buffer.
+    commands = []
+    currentIndex = 0
+    while currentIndex < inLength:
+        bestCommand = bestCommands[currentIndex]
+        bestLength = bestEnds[currentIndex] - currentIndex
+        if bestCommand == 0:
+            bestArgument = currentIndex
+        elif bestCommand == 2:
+            bestArgument = inBuffer[currentIndex]
+            bestArgument += (inBuffer[currentIndex + 1] << 8)
+        elif bestCommand <= 3:
+            bestArgument = inBuffer[currentIndex]
+        else:
+            bestArgument = sourceTables[bestCommand][currentIndex]
+        commands.append((bestCommand, bestLength, bestArgument))
+        currentIndex += bestLength
+
+    return commands
+
+
+
+def compress(inBytes, optimal=False):
+    # Prepare for compression.
+    inBuffer = bytearray(inBytes)
+    output = bytearray()
+
+    # Create a copy of the buffer where the bits of every byte are
+    # reversed (e.g. 0x80 <---> 0x01).
+    inBufferBitReversed = bytes(inBuffer).translate(
+        earthbound_decomp.BIT_REVERSED_BYTES
+    )
+
+    # Find the longest runs for every position in advance.
+    constantByteLengths = findConstantBytes(inBuffer)
+    constantWordLengths = findConstantWords(inBuffer)
+    incrementingByteLengths = findIncrementingBytes(inBuffer)
+
+    # Find the longest pastcopies for every position in advance.
+    inBufferReversed = bytes(inBuffer[::-1])
+    (
+        (forwardLengths, forwardSources),
+        (bitReversedLengths, bitReversedSources),
+        (backwardLengths, backwardSources),
+    ) = findPastBytes(inBuffer, inBufferBitReversed, inBufferReversed)
+
+    # Choose the commands to use, either greedily or optimally.
+    lengthTables = [
+        None,
+        constantByteLengths,
+        constantWordLengths,
+        incrementingByteLengths,
+        forwardLengths,
+        bitReversedLengths,
+        backwardLengths,
+    ]
+    sourceTables = [
+        None,
+        None,
+        None,
+        None,
+        forwardSources,
+        bitReversedSources,
+        backwardSources,
+    ]
+    if optimal:
+        commands = parseOptimal(inBuffer, lengthTables, sourceTables)
+    else:
+        commands = parseGreedy(inBuffer, lengthTables, sourceTables)
+
+    # Output the commands. Literals and search strings are taken from a
+    # memoryview, so they aren't copied before they're used.
+    inBufferView = memoryview(inBuffer)
+    currentIndex = 0
+    for command, count, argument in commands:
+        if command == 0:
+            argument = inBufferView[argument:argument + count]
+
+        # The match tables give one source for a pastcopy, but not
+        # necessarily the earliest. Use the earliest (as a search from the
+        # start of the buffer would find), so the output doesn't depend
+        # on how the tables were built.
+        elif command == 4:
+            argument = inBuffer.find(
+                inBufferView[currentIndex:currentIndex + count],
+                0,
+                argument + count,
+            )
+        elif command == 5:
+            argument = inBufferBitReversed.find(
+                inBufferView[currentIndex:currentIndex + count],
+                0,
+                argument + count,
+            )
+        elif command == 6:
+            # Search the reversed buffer from the end, so the first match
+            # found is for the earliest position.
+            argument = len(inBuffer) - 1 - inBufferReversed.rfind(
+                inBufferView[currentIndex:currentIndex + count],
+                len(inBuffer) - 1 - argument,
+                len(inBuffer) - 1,
+            )
+
+        encodeCommand(output, command, count, argument)
+        currentIndex += count
 
     # Append the 0xFF terminator.
     output.append(0xFF)
@@ -368,29 +606,35 @@ def touchopen(filename, *args, **kwargs):
 
 if __name__ == "__main__":
 
+    # Check for the optional "--optimal" flag.
+    args = sys.argv[1:]
+    optimal = "--optimal" in args
+    if optimal:
+        args.remove("--optimal")
+
     # Check for incorrect usage.
-    argc = len(sys.argv)
+    argc = len(args) + 1
     if argc < 2 or argc > 4:
-        print("Usage: {0:s} <inFile> [outFile] [outOffset]".format(
+        print("Usage: {0:s} [--optimal] <inFile> [outFile] [outOffset]".format(
             sys.argv[0]
         ))
         sys.exit(1)
 
     # Copy the arguments.
-    inFile = sys.argv[1]
+    inFile = args[0]
     outFile = None
     if argc == 3 or argc == 4:
-        outFile = sys.argv[2]
+        outFile = args[1]
     outOffset = 0
     if argc == 4:
-        outOffset = int(sys.argv[3], 16)
+        outOffset = int(args[2], 16)
 
     # Read the input file.
     with open(inFile, "rb") as inStream:
         inBytes = bytearray(inStream.read())
 
     # Compress the data.
-    outBytes = compress(inBytes)
+    outBytes = compress(inBytes, optimal)
 
     # Write the compressed output, if appropriate.
     if outFile is not None:
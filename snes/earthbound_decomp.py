@@ -62,102 +62,199 @@
 #
 #     - 111 has the arguments of its internal command.
 #
-# This code uses python-bitstring:
-# https://pypi.org/project/bitstring/
+# Every command starts on a byte boundary, so the decompressor reads
+# whole bytes and picks the bits apart itself.
 
 import sys
-import bitstring
+
+
+
+# Reverse the bits of a byte (e.g. 0x80 <---> 0x01).
+def reverseByte(currentByte):
+    currentByte = ((currentByte >> 4) & 0x0F) | ((currentByte << 4) & 0xF0)
+    currentByte = ((currentByte >> 2) & 0x33) | ((currentByte << 2) & 0xCC)
+    currentByte = ((currentByte >> 1) & 0x55) | ((currentByte << 1) & 0xAA)
+    return currentByte
+
+
+
+# Every byte with its bits reversed, for reversing a whole string of bytes
+# at once with translate(). (The compressor uses this too.)
+BIT_REVERSED_BYTES = bytes([reverseByte(x) for x in range(0x100)])
+
+# The bytes 0x00-0xFF, repeated enough times that any run of incrementing
+# bytes (up to 1024 long, starting anywhere) can be sliced out of it.
+INCREMENTING_BYTES = bytes(range(0x100)) * 5
 
 
 
 def decompress(inBytes, startOffset=0):
     # Prepare to read the compressed bytes.
-    inStream = bitstring.ConstBitStream(bytes=inBytes)
-    inStream.bytepos = startOffset
+    inView = memoryview(inBytes)
+    inPos = startOffset
 
     # Allocate memory for the decompression process.
     decomp = bytearray()
 
     # Main decompression loop.
-    # The conditional uses peek(), so the parsing position does not change.
-    while inStream.peek("uint:8") != 0xFF:
+    while inView[inPos] != 0xFF:
         # Read the next command.
-        nextCommand = inStream.read("uint:3")
+        nextByte = inView[inPos]
+        nextCommand = nextByte >> 5
 
         # Read the next count.
         nextCount = 0
         if nextCommand == 7:
             # 7 (111): Large-count command
-            nextCommand = inStream.read("uint:3")
-            nextCount = inStream.read("uint:10")
+            nextCommand = (nextByte >> 2) & 0x07
+            nextCount = ((nextByte & 0x03) << 8) | inView[inPos + 1]
+            inPos += 2
         else:
-            nextCount = inStream.read("uint:5")
+            nextCount = nextByte & 0x1F
+            inPos += 1
         nextCount += 1
 
         # Parse the next command.
         if nextCommand == 0:
             # 0 (000): Literal bytes
-            for i in range(nextCount):
-                decomp.append(inStream.read("uint:8"))
+            literalBytes = inView[inPos:inPos + nextCount]
+            if len(literalBytes) < nextCount:
+                raise IndexError("literal bytes past the end of the input")
+            decomp += literalBytes
+            inPos += nextCount
 
         elif nextCommand == 1:
             # 1 (001): Run of a constant byte
-            constantByte = inStream.read("uint:8")
-            for i in range(nextCount):
-                decomp.append(constantByte)
+            constantByte = inView[inPos]
+            inPos += 1
+            decomp += bytes((constantByte,)) * nextCount
 
         elif nextCommand == 2:
             # 2 (010): Run of a constant word
-            constantLow = inStream.read("uint:8")
-            constantHigh = inStream.read("uint:8")
-            for i in range(nextCount):
-                decomp.append(constantLow)
-                decomp.append(constantHigh)
+            constantLow = inView[inPos + 0]
+            constantHigh = inView[inPos + 1]
+            inPos += 2
+            decomp += bytes((constantLow, constantHigh)) * nextCount
 
         elif nextCommand == 3:
             # 3 (011): Run of incrementing bytes
-            incrementingByte = inStream.read("uint:8")
-            for i in range(nextCount):
-                decomp.append(incrementingByte)
-                incrementingByte += 1
-                incrementingByte &= 0xFF
+            incrementingByte = inView[inPos]
+            inPos += 1
+            decomp += INCREMENTING_BYTES[incrementingByte:incrementingByte + nextCount]
 
         elif nextCommand == 4:
             # 4 (100): Copy past bytes
-            pastIndex = inStream.read("uintbe:16")
-            for i in range(nextCount):
-                decomp.append(decomp[pastIndex])
-                pastIndex += 1
+            pastIndex = (inView[inPos] << 8) | inView[inPos + 1]
+            inPos += 2
+
+            # The copy may overlap the bytes it's writing. If so, the
+            # bytes from pastIndex onward repeat, so copy everything from
+            # pastIndex to the end each time, which doubles it.
+            while nextCount > 0:
+                pastBytes = decomp[pastIndex:pastIndex + nextCount]
+                if len(pastBytes) == 0:
+                    raise IndexError("copy source past the end of the output")
+                decomp += pastBytes
+                nextCount -= len(pastBytes)
 
         elif nextCommand == 5:
             # 5 (101): Copy past bytes (with bits in reverse order)
-            pastIndex = inStream.read("uintbe:16")
-            for i in range(nextCount):
-                # Reverse the bits of a past byte (e.g. 0x80 <---> 0x01)
-                pastByte = decomp[pastIndex]
-                pastByte = ((pastByte >> 4) & 0x0F) | ((pastByte << 4) & 0xF0)
-                pastByte = ((pastByte >> 2) & 0x33) | ((pastByte << 2) & 0xCC)
-                pastByte = ((pastByte >> 1) & 0x55) | ((pastByte << 1) & 0xAA)
-                decomp.append(pastByte)
-                pastIndex += 1
+            pastIndex = (inView[inPos] << 8) | inView[inPos + 1]
+            inPos += 2
+
+            # Like command 4, but reverse the bits of the past bytes. (An
+            # overlapping copy reads bytes it has already reversed, which
+            # don't repeat, so each chunk is only as long as the distance.)
+            while nextCount > 0:
+                pastBytes = decomp[pastIndex:pastIndex + nextCount]
+                if len(pastBytes) == 0:
+                    raise IndexError("copy source past the end of the output")
+                decomp += pastBytes.translate(BIT_REVERSED_BYTES)
+                pastIndex += len(pastBytes)
+                nextCount -= len(pastBytes)
 
         elif nextCommand == 6:
             # 6 (110): Copy past bytes (backward)
-            pastIndex = inStream.read("uintbe:16")
-            for i in range(nextCount):
-                decomp.append(decomp[pastIndex])
-                pastIndex -= 1
+            pastIndex = (inView[inPos] << 8) | inView[inPos + 1]
+            inPos += 2
+
+            # Reading backward never reaches the bytes being written, so
+            # this is a single reversed slice. (Unless the source runs off
+            # the start of the output, in which case the original one-byte-
+            # at-a-time loop wraps around to the end, which we keep.)
+            firstIndex = pastIndex - nextCount + 1
+            if firstIndex >= 0 and pastIndex < len(decomp):
+                decomp += decomp[firstIndex:pastIndex + 1][::-1]
+            else:
+                for i in range(nextCount):
+                    decomp.append(decomp[pastIndex])
+                    pastIndex -= 1
 
     # Consume the terminating 0xFF and calculate the end offset.
-    inStream.read("uint:8")
-    inStream.bytealign()
-    endOffset = inStream.bytepos
+    endOffset = inPos + 1
 
     # Return the decompressed data and end offset.
     return (decomp, endOffset)
 
 
 
+# Like decompress(), but only work out the size of the decompressed data.
+# Nothing is decompressed: the commands are read, and their arguments are
+# skipped over.
+def measure(inBytes, startOffset=0):
+    inPos = startOffset
+    decompSize = 0
+
+    # Main measuring loop.
+    while inBytes[inPos] != 0xFF:
+        # Read the next command.
+        nextByte = inBytes[inPos]
+        nextCommand = nextByte >> 5
+
+        # Read the next count.
+        nextCount = 0
+        if nextCommand == 7:
+            # 7 (111): Large-count command
+            nextCommand = (nextByte >> 2) & 0x07
+            nextCount = ((nextByte & 0x03) << 8) | inBytes[inPos + 1]
+            inPos += 2
+        else:
+            nextCount = nextByte & 0x1F
+            inPos += 1
+        nextCount += 1
+
+        # Skip the command's arguments.
+        if nextCommand == 0:
+            # 0 (000): Literal bytes
+            inPos += nextCount
+            decompSize += nextCount
+
+        elif nextCommand == 1 or nextCommand == 3:
+            # 1 (001): Run of a constant byte
+            # 3 (011): Run of incrementing bytes
+            inPos += 1
+            decompSize += nextCount
+
+        elif nextCommand == 2:
+            # 2 (010): Run of a constant word
+            inPos += 2
+            decompSize += nextCount * 2
+
+        elif nextCommand <= 6:
+            # 4 (100): Copy past bytes
+            # 5 (101): Copy past bytes (with bits in reverse order)
+            # 6 (110): Copy past bytes (backward)
+            inPos += 2
+            decompSize += nextCount
+
+    # Consume the terminating 0xFF and calculate the end offset.
+    endOffset = inPos + 1
+
+    # Return the decompressed size and end offset.
+    return (decompSize, endOffset)
+
+
+
 if __name__ == "__main__":
 
     # Check for incorrect usage.
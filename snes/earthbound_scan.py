@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+#
+# EarthBound Compressed Data Scanner
+# Osteoclave
+# 2026-10-18
+#
+# Finds EarthBound compressed data in a ROM without knowing where it is
+# ahead of time, decompresses all of it, and writes a manifest.
+#
+# Every offset in the ROM is a candidate. A candidate is checked by
+# walking its commands (without decompressing anything) and making sure
+# that they make sense:
+#
+#   - The commands end with an 0xFF byte before the end of the ROM.
+#   - Large-count commands don't contain another large-count command.
+#   - Pastcopies only copy from data that's already been decompressed,
+#     and backward pastcopies don't run off the start of it.
+#   - The decompressed data isn't too big (by default, 64 KB: pastcopy
+#     sources are 16-bit, so that's as far as they can reach).
+#   - The decompressed data isn't too small (by default, 256 bytes).
+#     Otherwise, every 0xFF byte in the ROM would count as a block.
+#
+# Candidates that pass are grouped by where they end. A compressed block
+# can have any amount of junk in front of it that happens to look like
+# valid commands, and once the commands from a junk offset line up with
+# the block's own, they end in the same place. Offsets partway into the
+# block can look valid too. So there's no telling which offset in a group
+# is the real start: all of them are kept. (Random data can also look
+# valid by chance, so the results are a starting point, not gospel.)
+#
+# Groups that end inside another one (found partway into a block) are
+# skipped, but ones that only overlap are kept, since either one might be
+# the junk. The data from every offset in every group that's left is
+# decompressed, written to the output directory, and listed in
+# "manifest.txt" there, one per line:
+#
+#   <startOffset> <endOffset> <compressedSize> <decompressedSize> <startCount> <file>
+#
+# The end offset is exclusive, and startCount is how many offsets the
+# group has. (If it's 1, the start is exact. Otherwise, the lines for the
+# other offsets share the same end offset.) All the numbers are in
+# hexadecimal.
+#
+# Both the checking and the decompressing are spread across processes.
+
+import concurrent.futures
+import mmap
+import os
+import sys
+import earthbound_decomp
+
+
+
+# How many candidate offsets each process checks at a time.
+SCAN_CHUNK_SIZE = 0x10000
+
+
+
+# Check whether the data at an offset looks like a valid compressed block.
+# Returns (endOffset, decompressedSize) if it does, or None if it doesn't.
+#
+# The commands from an offset are the same wherever the walk started. Only
+# the pastcopy checks depend on how much was decompressed before getting
+# there, so walks can share their work. walks maps each offset walked to
+# (endOffset, decompressedSize, neededSize) for the commands from there:
+# neededSize is how much has to be decompressed before them for their
+# pastcopies to check out. (It's None if they can't be part of any
+# block.) A walk stops as soon as it gets to an offset in walks.
+def checkBlock(romBytes, startOffset, maxSize=0x10000, walks=None):
+    if walks is None:
+        walks = {}
+    romSize = len(romBytes)
+    inPos = startOffset
+    decompSize = 0
+
+    # The commands walked so far, as (offset, count, pastIndex) tuples.
+    path = []
+
+    while True:
+        if inPos in walks:
+            result = walks[inPos]
+            break
+
+        if inPos >= romSize:
+            # We ran off the end of the ROM.
+            result = None
+            break
+
+        nextByte = romBytes[inPos]
+        if nextByte == 0xFF:
+            result = (inPos + 1, 0, 0)
+            break
+
+        # Read the next command and count.
+        commandPos = inPos
+        nextCommand = nextByte >> 5
+        if nextCommand == 7:
+            nextCommand = (nextByte >> 2) & 0x07
+            if nextCommand == 7 or inPos + 1 >= romSize:
+                result = None
+                break
+            nextCount = ((nextByte & 0x03) << 8) | romBytes[inPos + 1]
+            inPos += 2
+        else:
+            nextCount = nextByte & 0x1F
+            inPos += 1
+        nextCount += 1
+
+        # Skip over the arguments, keeping pastcopy sources to check later.
+        pastIndex = -1
+        if nextCommand == 0:
+            inPos += nextCount
+        elif nextCommand == 1 or nextCommand == 3:
+            inPos += 1
+        elif nextCommand == 2:
+            inPos += 2
+            nextCount *= 2
+        else:
+            if inPos + 1 >= romSize:
+                result = None
+                break
+            pastIndex = (romBytes[inPos] << 8) | romBytes[inPos + 1]
+            inPos += 2
+            if nextCommand == 6 and pastIndex + 1 < nextCount:
+                result = None
+                break
+
+        path.append((commandPos, nextCount, pastIndex))
+        decompSize += nextCount
+        if decompSize > maxSize:
+            # Too big: the commands from anywhere on the path that's already
+            # decompressed too much are no good. (Where the rest end isn't
+            # known yet.)
+            for commandPos, nextCount, pastIndex in path:
+                if decompSize <= maxSize:
+                    break
+                walks[commandPos] = None
+                decompSize -= nextCount
+            return None
+
+    # Work back along the path, and remember what we found at each offset.
+    # Each pastcopy needs its source decompressed before it. (If there's no
+    # room for that, the commands from there are no good.)
+    for commandPos, nextCount, pastIndex in reversed(path):
+        if result is not None:
+            endOffset, decompSize, neededSize = result
+            decompSize += nextCount
+            neededSize = max(pastIndex + 1, neededSize - nextCount)
+            result = (endOffset, decompSize, neededSize)
+            if decompSize + neededSize > maxSize:
+                result = None
+        walks[commandPos] = result
+
+    # Nothing can be decompressed before the start.
+    if result is None or result[2] > 0:
+        return None
+    return result[:2]
+
+
+
+# Check every candidate offset in part of a ROM, last to first, so that the
+# walks from each offset soon get to ones already walked.
+# Returns a list of (startOffset, endOffset, decompressedSize) tuples.
+def scanRange(romFile, firstOffset, lastOffset, minSize, maxSize):
+    candidates = []
+    walks = {}
+    with open(romFile, "rb") as romStream:
+        with mmap.mmap(romStream.fileno(), 0, access=mmap.ACCESS_READ) as romBytes:
+            for startOffset in range(lastOffset - 1, firstOffset - 1, -1):
+                result = checkBlock(romBytes, startOffset, maxSize, walks)
+                if result is not None and result[1] >= minSize:
+                    candidates.append((startOffset, result[0], result[1]))
+    candidates.reverse()
+    return candidates
+
+
+
+# Decompress one block and write it to a file.
+def decodeBlock(romFile, startOffset, outFile):
+    with open(romFile, "rb") as romStream:
+        with mmap.mmap(romStream.fileno(), 0, access=mmap.ACCESS_READ) as romBytes:
+            outBytes, endOffset = earthbound_decomp.decompress(romBytes, startOffset)
+    with open(outFile, "wb") as outStream:
+        outStream.write(outBytes)
+    return endOffset
+
+
+
+# Find all the compressed blocks in a ROM.
+# Returns a list of (endOffset, starts) tuples, where starts is a list of
+# (startOffset, decompressedSize) tuples for every offset the block could
+# start at.
+def scanRom(romFile, executor, minSize=0x100, maxSize=0x10000):
+    romSize = os.path.getsize(romFile)
+
+    # Check every offset, a chunk at a time.
+    chunkStarts = range(0, romSize, SCAN_CHUNK_SIZE)
+    futures = [
+        executor.submit(
+            scanRange,
+            romFile,
+            chunkStart,
+            min(chunkStart + SCAN_CHUNK_SIZE, romSize),
+            minSize,
+            maxSize,
+        )
+        for chunkStart in chunkStarts
+    ]
+
+    # Group the candidates by where they end. (They come out in order, so
+    # each group is in order too.)
+    groups = {}
+    for future in futures:
+        for startOffset, endOffset, decompSize in future.result():
+            groups.setdefault(endOffset, []).append((startOffset, decompSize))
+
+    # Take the groups in order of their first offset, skipping any that
+    # end inside one already taken. (Groups that only overlap the start of
+    # one are kept: they might be junk in front of a block, but dropping
+    # them might drop the block instead.)
+    blocks = []
+    lastEnd = 0
+    for endOffset, starts in sorted(groups.items(), key=lambda x: (x[1][0][0], -x[0])):
+        if endOffset > lastEnd:
+            blocks.append((endOffset, starts))
+            lastEnd = endOffset
+
+    return blocks
+
+
+
+if __name__ == "__main__":
+
+    # Check for incorrect usage.
+    argc = len(sys.argv)
+    if argc < 3 or argc > 4:
+        print("Usage: {0:s} <romFile> <outDir> [minSize]".format(
+            sys.argv[0]
+        ))
+        sys.exit(1)
+
+    # Copy the arguments.
+    romFile = sys.argv[1]
+    outDir = sys.argv[2]
+    minSize = 0x100
+    if argc == 4:
+        minSize = int(sys.argv[3], 16)
+
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        # Find the compressed blocks.
+        blocks = scanRom(romFile, executor, minSize)
+
+        # Decompress the data from every offset they could start at.
+        os.makedirs(outDir, exist_ok=True)
+        entries = [
+            (
+                startOffset,
+                endOffset,
+                decompSize,
+                len(starts),
+                os.path.join(outDir, "{0:06X}.bin".format(startOffset)),
+            )
+            for endOffset, starts in blocks
+            for startOffset, decompSize in starts
+        ]
+        futures = [
+            executor.submit(decodeBlock, romFile, entry[0], entry[4])
+            for entry in entries
+        ]
+        for future in futures:
+            future.result()
+
+    # Write the manifest.
+    with open(os.path.join(outDir, "manifest.txt"), "w") as manifestStream:
+        for startOffset, endOffset, decompSize, startCount, outFile in entries:
+            manifestStream.write("{0:06X} {1:06X} {2:X} {3:X} {4:X} {5:s}\n".format(
+                startOffset,
+                endOffset,
+                endOffset - startOffset,
+                decompSize,
+                startCount,
+                os.path.basename(outFile),
+            ))
+
+    # Report statistics on the data. (The sizes are for the first offset
+    # of each block.)
+    print("Blocks found: {0:d}".format(len(blocks)))
+    print("Blocks with more than one possible start: {0:d}".format(
+        sum(1 for _, starts in blocks if len(starts) > 1)
+    ))
+    print("Compressed size: 0x{0:X} ({0:d}) bytes".format(
+        sum(endOffset - starts[0][0] for endOffset, starts in blocks)
+    ))
+    print("Decompressed size: 0x{0:X} ({0:d}) bytes".format(
+        sum(starts[0][1] for _, starts in blocks)
+    ))
+
+    # Exit.
+    sys.exit(0)
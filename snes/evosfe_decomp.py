@@ -143,6 +143,64 @@ def decompress(romFile, startOffset):
 
 
 
+# Like decompress(), but only work out where the compressed data ends.
+# (The decompressed size is in the header.) Nothing is decompressed:
+# the commands are read, and literal bytes are skipped over.
+def measure(romFile, startOffset):
+    # Open the ROM.
+    romStream = open(romFile, "rb")
+    romStream.seek(startOffset)
+
+    # Prepare for measuring.
+    pastcopyByte = struct.unpack("<B", romStream.read(1))[0]
+    decompSize = struct.unpack("<H", romStream.read(2))[0]
+    decompPos = 0
+    controlByte = struct.unpack("<B", romStream.read(1))[0]
+    controlMask = 0x01
+
+    # Main measuring loop.
+    while decompPos < decompSize:
+        nextCommand = bool(controlByte & controlMask)
+
+        if nextCommand == False:
+            # 0: Pastcopy case.
+            pastCopy = struct.unpack("<H", romStream.read(2))[0]
+
+            # Copy length
+            copyLength = pastCopy & 0xF000
+            copyLength >>= 12
+            if (copyLength == 0xF) and bool(pastcopyByte & 0x80):
+                copyLength += struct.unpack("<B", romStream.read(1))[0]
+            copyLength += (pastcopyByte & 0x7F)
+
+            # Truncate copies that would exceed "decompSize" bytes.
+            decompPos += min(copyLength, decompSize - decompPos)
+
+        else:
+            # 1: Literal case.
+            romStream.seek(1, 1)
+            decompPos += 1
+
+        # Prepare to handle the next control bit.
+        controlMask <<= 1
+        if controlMask > 0x80:
+            controlByte = struct.unpack("<B", romStream.read(1))[0]
+            controlMask = 0x01
+
+    # Calculate the end offset.
+    # Compressed data is padded to fit in an even number of bytes.
+    endOffset = romStream.tell()
+    if ((endOffset - startOffset) % 2) == 1:
+        endOffset += 1
+
+    # Close the ROM.
+    romStream.close()
+
+    # Return the decompressed size and end offset.
+    return (decompSize, endOffset)
+
+
+
 if __name__ == "__main__":
 
     # Check for incorrect usage.
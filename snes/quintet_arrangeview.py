@@ -4,64 +4,243 @@
 # Osteoclave
 # 2011-11-15
 #
+# Renders one compressed arrangement as a PNG, or many of them at once:
+#
+#   - With "--batch", give a list of offsets.
+#   - With "--table", give the offset of a pointer table and how many
+#     pointers are in it. Pointers are three-byte little-endian LoROM
+#     addresses.
+#
+# Batches are decompressed and rendered across processes. Each
+# arrangement is written to "<offset>.png" in the output directory, or
+# with "--atlas", they're all put on one contact sheet ("atlas.png"), left
+# to right and top to bottom, and listed in "atlas.txt" there:
+#
+#   <startOffset> <x> <y> <width> <height>
+#
+# All the numbers (on the command line, too) are in hexadecimal.
+#
+# Decompressed arrangements are cached on disk (see decompcache.py), so
+# rendering the same ones again skips decompressing them. Use "--no-cache"
+# to turn this off.
+#
+# This code uses NumPy:
+# https://pypi.org/project/numpy/
+#
 # This code uses the Pillow fork of the Python Imaging Library (PIL):
 # https://pypi.org/project/Pillow/
 
+import concurrent.futures
+import math
+import mmap
+import os
 import sys
+import numpy
+import decompcache
 import quintet_decomp
 
 from PIL import Image
 
 
 
-# Check for incorrect usage.
-argc = len(sys.argv)
-if argc < 3 or argc > 4:
-    print("Usage: {0:s} <inFile> <startOffset> [outFile]".format(sys.argv[0]))
-    sys.exit(1)
+# The color of each tile number. This produces a nice orange-and-blue
+# scheme.
+TILE_COLORS = numpy.array(
+    [
+        (
+            0xFF - abs(currentTile - 0x40),
+            0xD0 - abs(currentTile - 0x80),
+            0xFF - abs(currentTile - 0xC0)
+        )
+        for currentTile in range(0x100)
+    ],
+    dtype=numpy.uint8
+)
 
-# Copy the arguments.
-inFile = sys.argv[1]
-startOffset = int(sys.argv[2], 16)
-outFile = "{0:s}_{1:06X}.png".format(inFile, startOffset)
-if argc == 4:
-    outFile = sys.argv[3]
+# How much single arrangements are scaled up by. (Atlases aren't.)
+IMAGE_SCALE = 4
 
-# Read the input file.
-with open(inFile, "rb") as inStream:
-    inBytes = inStream.read()
+# The space between arrangements on an atlas, in pixels.
+ATLAS_SPACING = 8
 
-# Read the size bytes.
-xSize = 0x10 * inBytes[startOffset + 0]
-ySize = 0x10 * inBytes[startOffset + 1]
 
-# Decompress the arrangement data.
-outBytes, endOffset = quintet_decomp.decompress(inBytes, startOffset + 2)
 
-# Create the arrangement bitmap.
-canvas = Image.new("RGB", (xSize, ySize))
+# Read and decompress an arrangement. If cacheDir isn't None, the
+# decompression cache there is used.
+# Returns a 2-D array of tile numbers, in pixel order.
+def readArrangement(romBytes, startOffset, cacheDir=None):
+    # Read the size bytes.
+    xSize = 0x10 * romBytes[startOffset + 0]
+    ySize = 0x10 * romBytes[startOffset + 1]
 
-for y in range(ySize):
-    for x in range(xSize):
+    # Decompress the arrangement data.
+    if cacheDir is None:
+        outBytes, endOffset = quintet_decomp.decompress(romBytes, startOffset + 2)
+    else:
+        outBytes, endOffset = decompcache.decompress(
+            quintet_decomp, romBytes, startOffset + 2, cacheDir
+        )
 
-        currentIndex = 0
-        currentIndex += (0x10 * xSize * (y // 0x10))
-        currentIndex += (0x100 * (x // 0x10))
-        currentIndex += (0x10 * (y % 0x10))
-        currentIndex += (0x1 * (x % 0x10))
+    # Put the tiles in order. The arrangement is made of 16x16 blocks, stored
+    # left to right, top to bottom, and each block is stored row by row. So
+    # the data is indexed [blockY][blockX][y][x], and swapping the middle two
+    # gives [blockY][y][blockX][x], which is the order of the pixels.
+    tiles = numpy.frombuffer(outBytes, dtype=numpy.uint8, count=xSize * ySize)
+    tiles = tiles.reshape(ySize // 0x10, xSize // 0x10, 0x10, 0x10)
+    tiles = tiles.transpose(0, 2, 1, 3).reshape(ySize, xSize)
+    return tiles
 
-        currentTile = outBytes[currentIndex]
 
-        # This produces a nice orange-and-blue scheme.
-        canvas.putpixel(
-            (x, y),
-            (
-                0xFF - abs(currentTile - 0x40),
-                0xD0 - abs(currentTile - 0x80),
-                0xFF - abs(currentTile - 0xC0)
-            )
-        )
 
-# Output a scaled-up version of the image, and exit.
-canvas.resize((xSize * 4, ySize * 4), Image.NEAREST).save(outFile, "PNG")
-sys.exit(0)
+# Read an arrangement from a ROM file.
+def loadArrangement(romFile, startOffset, cacheDir=None):
+    with open(romFile, "rb") as romStream:
+        with mmap.mmap(romStream.fileno(), 0, access=mmap.ACCESS_READ) as romBytes:
+            return readArrangement(romBytes, startOffset, cacheDir)
+
+
+
+# Create the bitmap for an arrangement.
+def renderArrangement(tiles):
+    return Image.fromarray(TILE_COLORS[tiles])
+
+
+
+# Render an arrangement from a ROM file, and write it to a PNG file.
+def saveArrangement(romFile, startOffset, outFile, cacheDir=None):
+    canvas = renderArrangement(loadArrangement(romFile, startOffset, cacheDir))
+    xSize, ySize = canvas.size
+
+    # Output a scaled-up version of the image.
+    canvas = canvas.resize((xSize * IMAGE_SCALE, ySize * IMAGE_SCALE), Image.NEAREST)
+    canvas.save(outFile, "PNG")
+
+
+
+# Read the offsets of the arrangements in a pointer table.
+def readPointerTable(romFile, tableOffset, count):
+    with open(romFile, "rb") as romStream:
+        romStream.seek(tableOffset)
+        tableBytes = romStream.read(3 * count)
+
+    offsets = []
+    for i in range(0, 3 * count, 3):
+        pointer = int.from_bytes(tableBytes[i:i + 3], "little")
+        # Convert the LoROM address to a file offset.
+        offsets.append(((pointer & 0x7F0000) >> 1) | (pointer & 0x7FFF))
+    return offsets
+
+
+
+# Put a list of arrangements (2-D arrays of tile numbers) on a grid, and
+# create the bitmap for it. Returns the bitmap and the position of each
+# arrangement on it.
+def buildAtlas(arrangements):
+    columnCount = math.ceil(math.sqrt(len(arrangements)))
+    cellWidth = max(tiles.shape[1] for tiles in arrangements) + ATLAS_SPACING
+    cellHeight = max(tiles.shape[0] for tiles in arrangements) + ATLAS_SPACING
+    rowCount = math.ceil(len(arrangements) / columnCount)
+
+    atlas = Image.new(
+        "RGB",
+        (columnCount * cellWidth - ATLAS_SPACING, rowCount * cellHeight - ATLAS_SPACING)
+    )
+    positions = []
+    for i, tiles in enumerate(arrangements):
+        position = ((i % columnCount) * cellWidth, (i // columnCount) * cellHeight)
+        atlas.paste(renderArrangement(tiles), position)
+        positions.append(position)
+    return (atlas, positions)
+
+
+
+if __name__ == "__main__":
+
+    # Check for the optional flags.
+    args = sys.argv[1:]
+    flags = {"--batch", "--table", "--atlas", "--no-cache"}
+    usedFlags = set(arg for arg in args if arg in flags)
+    args = [arg for arg in args if arg not in flags]
+    batch = "--batch" in usedFlags
+    table = "--table" in usedFlags
+    atlas = "--atlas" in usedFlags
+    cacheDir = decompcache.DEFAULT_CACHE_DIR
+    if "--no-cache" in usedFlags:
+        cacheDir = None
+
+    # Check for incorrect usage.
+    argc = len(args) + 1
+    if (
+        (batch and table)
+        or (atlas and not (batch or table))
+        or (batch and argc < 4)
+        or (table and argc != 5)
+        or (not (batch or table) and (argc < 3 or argc > 4))
+    ):
+        print("Usage: {0:s} [--no-cache] <inFile> <startOffset> [outFile]".format(sys.argv[0]))
+        print("       {0:s} --batch [--atlas] [--no-cache] <inFile> <outDir> <startOffset> [startOffset ...]".format(sys.argv[0]))
+        print("       {0:s} --table [--atlas] [--no-cache] <inFile> <outDir> <tableOffset> <count>".format(sys.argv[0]))
+        sys.exit(1)
+
+    # Render a single arrangement, and exit.
+    if not (batch or table):
+        inFile = args[0]
+        startOffset = int(args[1], 16)
+        outFile = "{0:s}_{1:06X}.png".format(inFile, startOffset)
+        if argc == 4:
+            outFile = args[2]
+        saveArrangement(inFile, startOffset, outFile, cacheDir)
+        sys.exit(0)
+
+    # Copy the arguments.
+    inFile = args[0]
+    outDir = args[1]
+    if batch:
+        startOffsets = [int(arg, 16) for arg in args[2:]]
+    else:
+        startOffsets = readPointerTable(inFile, int(args[2], 16), int(args[3], 16))
+
+    # Tables can point to the same arrangement more than once, but each
+    # one only needs to be rendered once.
+    startOffsets = sorted(set(startOffsets))
+    os.makedirs(outDir, exist_ok=True)
+
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        if atlas:
+            # Decompress the arrangements, and put them all on one atlas.
+            arrangements = list(executor.map(
+                loadArrangement,
+                [inFile] * len(startOffsets),
+                startOffsets,
+                [cacheDir] * len(startOffsets),
+            ))
+            atlasImage, positions = buildAtlas(arrangements)
+            atlasImage.save(os.path.join(outDir, "atlas.png"), "PNG")
+
+            # List where each one is.
+            with open(os.path.join(outDir, "atlas.txt"), "w") as listStream:
+                for startOffset, (x, y), tiles in zip(startOffsets, positions, arrangements):
+                    listStream.write("{0:06X} {1:X} {2:X} {3:X} {4:X}\n".format(
+                        startOffset, x, y, tiles.shape[1], tiles.shape[0]
+                    ))
+
+        else:
+            # Render the arrangements to their own files.
+            futures = [
+                executor.submit(
+                    saveArrangement,
+                    inFile,
+                    startOffset,
+                    os.path.join(outDir, "{0:06X}.png".format(startOffset)),
+                    cacheDir,
+                )
+                for startOffset in startOffsets
+            ]
+            for future in futures:
+                future.result()
+
+    # Report statistics on the data.
+    print("Arrangements rendered: {0:d}".format(len(startOffsets)))
+
+    # Exit.
+    sys.exit(0)
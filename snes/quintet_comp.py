@@ -5,11 +5,9 @@
 # 2012-02-04
 #
 # The compression format is described in the decompressor.
-#
-# This code uses python-bitstring:
-# https://pypi.org/project/bitstring/
 
-import bitstring
+import collections
+import bitwriter
 
 
 
@@ -22,23 +20,44 @@ PASTCOPY_MAX_LENGTH = PASTCOPY_MIN_LENGTH + (2 ** LOOKAHEAD_LOG2) - 1
 BIT_PASTCOPY = 0
 BIT_LITERAL = 1
 
+# The size of each kind of block, in bits.
+LITERAL_SIZE = 1 + 8
+PASTCOPY_SIZE = 1 + SEARCH_LOG2 + LOOKAHEAD_LOG2
 
 
-def compress(inBytes):
-    # Prepare the memory buffer.
-    inBuffer = bytearray(SEARCH_SIZE + len(inBytes))
-    inBuffer[:SEARCH_SIZE] = [0x20] * SEARCH_SIZE
-    inBuffer[SEARCH_SIZE:] = inBytes
 
-    # Prepare for compression.
-    output = bitstring.BitArray()
-    output += bitstring.pack("uintle:16", len(inBytes))
-    currentIndex = SEARCH_SIZE
+# Find the longest pastcopy at every position in the buffer. The search
+# buffer holds the 256 bytes before the position (to start with, the
+# 0x20s that the decompressor's window is filled with).
+#
+# Returns (matchLengths, matchSources). Where no pastcopy is possible, the
+# length is zero. If several sources give the longest pastcopy, the
+# earliest one is used.
+def findMatches(inBuffer):
+    matchLengths = [0] * len(inBuffer)
+    matchSources = [0] * len(inBuffer)
 
-    # Main compression loop.
-    while currentIndex < len(inBuffer):
-        bestIndex = 0
-        bestLength = 0
+    # For every pair of bytes, keep a list of the positions in the search
+    # buffer where it appears (oldest first). A pastcopy has to match at
+    # least two bytes, so only those positions are worth comparing.
+    pairPositions = collections.defaultdict(collections.deque)
+
+    for currentIndex in range(len(inBuffer)):
+        # Update the lists for the current search buffer: forget the
+        # position that has slid out of it, and add the one that has slid
+        # into it. (The pair that slides out is the oldest in its list.)
+        if currentIndex > SEARCH_SIZE:
+            oldPosition = currentIndex - SEARCH_SIZE - 1
+            oldPair = (inBuffer[oldPosition] << 8) | inBuffer[oldPosition + 1]
+            pairPositions[oldPair].popleft()
+        if currentIndex > 0:
+            newPosition = currentIndex - 1
+            newPair = (inBuffer[newPosition] << 8) | inBuffer[newPosition + 1]
+            pairPositions[newPair].append(newPosition)
+
+        # The 0x20s at the start of the buffer don't need compressing.
+        if currentIndex < SEARCH_SIZE:
+            continue
 
         # Don't compare past the end of the memory buffer.
         # Don't compare past the end of the lookahead buffer.
@@ -46,43 +65,131 @@ def compress(inBytes):
             len(inBuffer) - currentIndex,
             PASTCOPY_MAX_LENGTH,
         )
+        if compareLimit < PASTCOPY_MIN_LENGTH:
+            continue
 
-        # Look for a match in the search buffer. (Brute force)
-        for i in range(SEARCH_SIZE):
+        # Look for a match in the search buffer, oldest position first.
+        bestIndex = 0
+        bestLength = 0
+        currentPair = (inBuffer[currentIndex] << 8) | inBuffer[currentIndex + 1]
+        for i in pairPositions.get(currentPair, ()):
             # Compare the search buffer to the lookahead buffer.
-            # Count how many sequential bytes match (possibly zero).
-            currentLength = 0
-            for j in range(compareLimit):
-                if inBuffer[currentIndex - SEARCH_SIZE + i + j] == inBuffer[currentIndex + j]:
-                    currentLength += 1
-                else:
-                    break
+            # Count how many sequential bytes match (at least two).
+            currentLength = PASTCOPY_MIN_LENGTH
+            while (
+                currentLength < compareLimit
+                and inBuffer[i + currentLength] == inBuffer[currentIndex + currentLength]
+            ):
+                currentLength += 1
 
             # Keep track of the largest match we've seen.
             if currentLength > bestLength:
-                bestIndex = currentIndex - SEARCH_SIZE + i
+                bestIndex = i
                 bestLength = currentLength
 
                 # If we've found a maximum-possible-length match, break.
                 if bestLength == compareLimit:
                     break
 
+        matchLengths[currentIndex] = bestLength
+        matchSources[currentIndex] = bestIndex
+
+    return (matchLengths, matchSources)
+
+
+
+# Choose the pastcopy lengths by always using the longest one possible.
+# Returns a list with the length of the pastcopy at every position (zero
+# for a literal).
+def parseGreedy(inBuffer, matchLengths):
+    copyLengths = [0] * len(inBuffer)
+    currentIndex = SEARCH_SIZE
+    while currentIndex < len(inBuffer):
+        if matchLengths[currentIndex] >= PASTCOPY_MIN_LENGTH:
+            copyLengths[currentIndex] = matchLengths[currentIndex]
+            currentIndex += matchLengths[currentIndex]
+        else:
+            currentIndex += 1
+    return copyLengths
+
+
+
+# Choose the pastcopy lengths by finding the smallest possible output.
+# Work backward from the end of the buffer: the best output from each
+# position is the smallest of (size of a literal) + (best output from the
+# next position), or (size of a pastcopy) + (best output from where it
+# ends), for every pastcopy length possible. Every length shorter than
+# the longest pastcopy is also possible (using the same source).
+#
+# Returns the same kind of list as parseGreedy().
+def parseOptimal(inBuffer, matchLengths):
+    copyLengths = [0] * len(inBuffer)
+    bestSizes = [0] * (len(inBuffer) + 1)
+
+    for currentIndex in range(len(inBuffer) - 1, SEARCH_SIZE - 1, -1):
+        bestSize = bestSizes[currentIndex + 1] + LITERAL_SIZE
+        bestLength = 0
+
+        maxLength = matchLengths[currentIndex]
+        if maxLength >= PASTCOPY_MIN_LENGTH:
+            candidateSizes = bestSizes[
+                currentIndex + PASTCOPY_MIN_LENGTH:currentIndex + maxLength + 1
+            ]
+            candidateSize = min(candidateSizes) + PASTCOPY_SIZE
+            if candidateSize <= bestSize:
+                bestSize = candidateSize
+                bestLength = candidateSizes.index(candidateSize - PASTCOPY_SIZE)
+                bestLength += PASTCOPY_MIN_LENGTH
+
+        bestSizes[currentIndex] = bestSize
+        copyLengths[currentIndex] = bestLength
+
+    return copyLengths
+
+
+
+# If optimal is True, use the smallest possible output instead of always
+# taking the longest pastcopy. (It's slower, but not by much.)
+def compress(inBytes, optimal=False):
+    if len(inBytes) > 0xFFFF:
+        raise ValueError("data must be at most 65535 bytes long")
+
+    # Prepare the memory buffer.
+    inBuffer = bytearray(SEARCH_SIZE + len(inBytes))
+    inBuffer[:SEARCH_SIZE] = [0x20] * SEARCH_SIZE
+    inBuffer[SEARCH_SIZE:] = inBytes
+
+    # Find the pastcopies, and choose which ones to use.
+    matchLengths, matchSources = findMatches(inBuffer)
+    if optimal:
+        copyLengths = parseOptimal(inBuffer, matchLengths)
+    else:
+        copyLengths = parseGreedy(inBuffer, matchLengths)
+
+    # Prepare for compression.
+    # (The header is little-endian.)
+    output = bitwriter.BitWriter()
+    output.write(len(inBytes) & 0xFF, 8)
+    output.write(len(inBytes) >> 8, 8)
+    currentIndex = SEARCH_SIZE
+
+    # Main compression loop.
+    while currentIndex < len(inBuffer):
+        bestIndex = matchSources[currentIndex]
+        bestLength = copyLengths[currentIndex]
+
         # Write the next block of compressed output.
         if bestLength >= PASTCOPY_MIN_LENGTH:
             # For some reason, the decompressor expects the pastcopy
             # source values to be offset by 0xEF. I have no idea why.
             bestIndex = (bestIndex + 0xEF) & 0xFF
-            output += bitstring.pack("uint:1", BIT_PASTCOPY)
-            output += bitstring.pack(
-                "uint:n=v", n = SEARCH_LOG2, v = bestIndex
-            )
-            output += bitstring.pack(
-                "uint:n=v", n = LOOKAHEAD_LOG2, v = bestLength - PASTCOPY_MIN_LENGTH
-            )
+            output.write(BIT_PASTCOPY, 1)
+            output.write(bestIndex, SEARCH_LOG2)
+            output.write(bestLength - PASTCOPY_MIN_LENGTH, LOOKAHEAD_LOG2)
             currentIndex += bestLength
         else:
-            output += bitstring.pack("uint:1", BIT_LITERAL)
-            output += bitstring.pack("uint:8", inBuffer[currentIndex])
+            output.write(BIT_LITERAL, 1)
+            output.write(inBuffer[currentIndex], 8)
             currentIndex += 1
 
     # Return the compressed data.
@@ -100,29 +207,35 @@ if __name__ == "__main__":
         fd = os.open(filename, os.O_RDWR | os.O_CREAT)
         return os.fdopen(fd, *args, **kwargs)
 
+    # Check for the optional "--optimal" flag.
+    args = sys.argv[1:]
+    optimal = "--optimal" in args
+    if optimal:
+        args.remove("--optimal")
+
     # Check for incorrect usage.
-    argc = len(sys.argv)
+    argc = len(args) + 1
     if argc < 2 or argc > 4:
-        print("Usage: {0:s} <inFile> [outFile] [outOffset]".format(
+        print("Usage: {0:s} [--optimal] <inFile> [outFile] [outOffset]".format(
             sys.argv[0]
         ))
         sys.exit(1)
 
     # Copy the arguments.
-    inFile = sys.argv[1]
+    inFile = args[0]
     outFile = None
     if argc == 3 or argc == 4:
-        outFile = sys.argv[2]
+        outFile = args[1]
     outOffset = 0
     if argc == 4:
-        outOffset = int(sys.argv[3], 16)
+        outOffset = int(args[2], 16)
 
     # Read the input file.
     with open(inFile, "rb") as inStream:
         inBytes = bytearray(inStream.read())
 
     # Compress the data.
-    outBytes = compress(inBytes)
+    outBytes = compress(inBytes, optimal)
 
     # Write the compressed output, if appropriate.
     if outFile is not None:
@@ -56,73 +56,144 @@
 #     (i.e. copying from sliding window positions that haven't been
 #     filled with decompressed bytes yet), which happens if the
 #     original data had 0x20s early on.
-#
-# This code uses python-bitstring:
-# https://pypi.org/project/bitstring/
 
 import sys
-import bitstring
+
+
+
+# Define some useful constants.
+SEARCH_LOG2 = 8
+SEARCH_SIZE = 2 ** SEARCH_LOG2
+LOOKAHEAD_LOG2 = 4
+LOOKAHEAD_SIZE = 2 ** LOOKAHEAD_LOG2
+BIT_PASTCOPY = 0
+BIT_LITERAL = 1
 
 
 
 def decompress(inBytes, startOffset=0):
-    # Define some useful constants.
-    SEARCH_LOG2 = 8
-    SEARCH_SIZE = 2 ** SEARCH_LOG2
-    LOOKAHEAD_LOG2 = 4
-    LOOKAHEAD_SIZE = 2 ** LOOKAHEAD_LOG2
-    BIT_PASTCOPY = 0
-    BIT_LITERAL = 1
+    # Prepare to read the compressed bytes. Bits are read from an int,
+    # which is refilled a byte at a time.
+    inPos = startOffset
+    bitBuffer = 0
+    bitCount = 0
+
+    # Allocate memory for the decompression process. The sliding window
+    # is always the last 256 bytes written, so the output starts with the
+    # 0x20s that fill the window, and the window is read from the output.
+    decompSize = inBytes[inPos] | (inBytes[inPos + 1] << 8)
+    inPos += 2
+    decomp = bytearray([0x20] * SEARCH_SIZE)
+    decompEnd = SEARCH_SIZE + decompSize
+
+    # Main decompression loop.
+    while len(decomp) < decompEnd:
+        # Read the next command (and make sure there's enough for a literal).
+        while bitCount < 1 + 8:
+            bitBuffer = (bitBuffer << 8) | inBytes[inPos]
+            inPos += 1
+            bitCount += 8
+        bitCount -= 1
+        nextCommand = (bitBuffer >> bitCount) & 1
+
+        if nextCommand == BIT_PASTCOPY:
+            # 0: Pastcopy case.
+            while bitCount < SEARCH_LOG2 + LOOKAHEAD_LOG2:
+                bitBuffer = (bitBuffer << 8) | inBytes[inPos]
+                inPos += 1
+                bitCount += 8
+            bitCount -= SEARCH_LOG2
+            copySource = (bitBuffer >> bitCount) & (SEARCH_SIZE - 1)
+            bitCount -= LOOKAHEAD_LOG2
+            copyLength = (bitBuffer >> bitCount) & (LOOKAHEAD_SIZE - 1)
+            copyLength += 2
+
+            # Truncate copies that would exceed "decompSize" bytes.
+            copyLength = min(copyLength, decompEnd - len(decomp))
+
+            # The next byte would be written to window position
+            # (0xEF + number of bytes written so far). Work out how far
+            # back the source is from there (1-256 bytes).
+            windowPos = (0xEF + len(decomp) - SEARCH_SIZE) % SEARCH_SIZE
+            copyDistance = ((windowPos - copySource - 1) % SEARCH_SIZE) + 1
+            copySource = len(decomp) - copyDistance
+
+            # The copy may overlap the bytes it's writing. If so, the
+            # bytes from the source onward repeat every copyDistance bytes,
+            # so copy everything from the source to the end each time,
+            # which doubles it.
+            while copyLength > 0:
+                pastBytes = decomp[copySource:copySource + copyLength]
+                decomp += pastBytes
+                copyLength -= len(pastBytes)
 
+        elif nextCommand == BIT_LITERAL:
+            # 1: Literal case.
+            bitCount -= 8
+            decomp.append((bitBuffer >> bitCount) & 0xFF)
+
+        # Throw away the bits we've used.
+        bitBuffer &= (1 << bitCount) - 1
+
+    # Calculate the end offset. (Any bits left over are padding in the
+    # last byte read.)
+    endOffset = inPos
+
+    # Return the decompressed data and end offset.
+    return (decomp[SEARCH_SIZE:], endOffset)
+
+
+
+# Like decompress(), but only work out where the compressed data ends.
+# (The decompressed size is in the header.) Nothing is decompressed:
+# the commands are read, and their arguments are skipped over.
+def measure(inBytes, startOffset=0):
     # Prepare to read the compressed bytes.
-    inStream = bitstring.ConstBitStream(bytes=inBytes)
-    inStream.bytepos = startOffset
+    inPos = startOffset
+    bitBuffer = 0
+    bitCount = 0
 
-    # Allocate memory for the decompression process.
-    decompSize = inStream.read("uintle:16")
-    decomp = bytearray([0x00] * decompSize)
+    # Read the size of the decompressed data.
+    decompSize = inBytes[inPos] | (inBytes[inPos + 1] << 8)
+    inPos += 2
     decompPos = 0
-    window = bytearray([0x20] * SEARCH_SIZE)
-    windowPos = 0xEF
 
-    # Main decompression loop.
+    # Main measuring loop.
     while decompPos < decompSize:
-        nextCommand = inStream.read("uint:1")
+        # Read the next command (and make sure there's enough for a literal).
+        while bitCount < 1 + 8:
+            bitBuffer = (bitBuffer << 8) | inBytes[inPos]
+            inPos += 1
+            bitCount += 8
+        bitCount -= 1
+        nextCommand = (bitBuffer >> bitCount) & 1
 
         if nextCommand == BIT_PASTCOPY:
             # 0: Pastcopy case.
-            copySource = inStream.read(SEARCH_LOG2).uint
-            copyLength = inStream.read(LOOKAHEAD_LOG2).uint
+            while bitCount < SEARCH_LOG2 + LOOKAHEAD_LOG2:
+                bitBuffer = (bitBuffer << 8) | inBytes[inPos]
+                inPos += 1
+                bitCount += 8
+            bitCount -= SEARCH_LOG2 + LOOKAHEAD_LOG2
+            copyLength = (bitBuffer >> bitCount) & (LOOKAHEAD_SIZE - 1)
             copyLength += 2
 
             # Truncate copies that would exceed "decompSize" bytes.
-            if (decompPos + copyLength) >= decompSize:
-                copyLength = decompSize - decompPos
-
-            for i in range(copyLength):
-                decomp[decompPos] = window[copySource]
-                decompPos += 1
-                window[windowPos] = window[copySource]
-                windowPos += 1
-                windowPos %= SEARCH_SIZE
-                copySource += 1
-                copySource %= SEARCH_SIZE
+            decompPos += min(copyLength, decompSize - decompPos)
 
         elif nextCommand == BIT_LITERAL:
             # 1: Literal case.
-            literalByte = inStream.read("uint:8")
-            decomp[decompPos] = literalByte
+            bitCount -= 8
             decompPos += 1
-            window[windowPos] = literalByte
-            windowPos += 1
-            windowPos %= SEARCH_SIZE
+
+        # Throw away the bits we've used.
+        bitBuffer &= (1 << bitCount) - 1
 
     # Calculate the end offset.
-    inStream.bytealign()
-    endOffset = inStream.bytepos
+    endOffset = inPos
 
-    # Return the decompressed data and end offset.
-    return (decomp, endOffset)
+    # Return the decompressed size and end offset.
+    return (decompSize, endOffset)
 
 
 
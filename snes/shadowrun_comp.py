@@ -5,66 +5,255 @@
 # 2016-02-06
 #
 # The compression format is described in the decompressor.
-#
-# This code uses python-bitstring:
-# https://pypi.org/project/bitstring/
 
 import os
 import sys
-import bitstring
+import bitwriter
+import sizewindow
+import suffixarray
+
+
+
+# Define some useful constants.
+BIT_LITERAL = 0
+BIT_PASTCOPY = 1
+
+
+
+# Write the control bits for a run of literals, ending at endIndex.
+def writeLiterals(controlSection, literalCount, endIndex):
+    # The first command is always literal, so we don't need to waste a bit
+    # saying so.
+    if endIndex > literalCount:
+        controlSection.write(BIT_LITERAL, 1)
+    controlSection.write_uie(literalCount - 1)
+
+
+
+# Find the length of the longest pastcopy at every position. A pastcopy
+# can start at any earlier position, and run to the end of the input.
+# (See suffixarray.py for how.)
+def findMatches(inBytes):
+    n = len(inBytes)
+    if n == 0:
+        return []
+
+    suffixArray = suffixarray.buildSuffixArray(inBytes)
+    lcpArray = suffixarray.buildLcpArray(inBytes, suffixArray)
+    matchLengths, _ = suffixarray.findMatches(suffixArray, lcpArray, n, range(n))
+    return matchLengths
+
+
+
+# The number of bits in an interleaved exponential-Golomb code.
+def uieSize(value):
+    return 2 * (value + 1).bit_length() - 1
+
+
+
+# Choose the pastcopy lengths by always using the longest one possible.
+# Returns a list with the length of the pastcopy at every position (zero
+# for a literal).
+def parseGreedy(matchLengths):
+    copyLengths = [0] * len(matchLengths)
+    currentIndex = 0
+    while currentIndex < len(matchLengths):
+        if matchLengths[currentIndex] >= 3:
+            copyLengths[currentIndex] = matchLengths[currentIndex]
+            currentIndex += matchLengths[currentIndex]
+        else:
+            currentIndex += 1
+    return copyLengths
+
+
+
+# Choose the pastcopy lengths by finding the smallest possible output, in
+# bits. Work backward from the end of the input, keeping two best sizes
+# for each position: one for after a pastcopy, where either command can
+# come next (and costs a bit to say which), and one for after a literal,
+# where only a pastcopy can come next (and costs nothing to say so).
+#
+#   - A run of k literals costs 8k bits, plus the exponential-Golomb code
+#     for k. (The first command is always literal, so it costs nothing to
+#     say so.)
+#   - A pastcopy costs the bits for its source (as many as the position
+#     needs), plus the exponential-Golomb code for its length. Every
+#     length from 3 to the longest match is possible.
+#
+# Longer commands never have shorter codes, so a command is only worth
+# considering if it ends where the best size is smaller than anywhere
+# closer, which is what the windows keep. And codes are the same size
+# for every value from (2**j - 1) up to (2**(j + 1) - 2), so for each j,
+# the command that ends where the best size is smallest is the only one
+# that needs to be considered.
+#
+# Returns the same kind of list as parseGreedy().
+def parseOptimal(matchLengths):
+    inLength = len(matchLengths)
+    copyLengths = [0] * inLength
+
+    # afterPastcopy[i] and afterLiteral[i] are the best sizes from i to
+    # the end. Where there's no way to continue (a literal can't follow
+    # a literal, and a pastcopy needs a match), the size is None.
+    afterPastcopy = [None] * (inLength + 1)
+    afterLiteral = [None] * (inLength + 1)
+    afterPastcopy[inLength] = 0
+    afterLiteral[inLength] = 0
 
+    # The command chosen at each position for each best size: the length
+    # of a pastcopy, or the number of literals (negated).
+    afterPastcopyChoices = [0] * inLength
+    afterLiteralChoices = [0] * inLength
 
+    # Windows over the best sizes where commands can end. Literals use
+    # (8 * position + size), so the number of literal bytes is taken into
+    # account.
+    literalWindow = ([], [])
+    pastcopyWindow = ([], [])
 
-def compress(inBytes):
-    # Define some useful constants.
-    BIT_LITERAL = 0
-    BIT_PASTCOPY = 1
+    for currentIndex in range(inLength - 1, -1, -1):
+        # Add the newly-reachable positions to the windows.
+        nextIndex = currentIndex + 1
+        if afterLiteral[nextIndex] is not None:
+            sizewindow.addToWindow(
+                literalWindow, nextIndex, 8 * nextIndex + afterLiteral[nextIndex]
+            )
+        nextIndex = currentIndex + 3
+        if nextIndex <= inLength:
+            sizewindow.addToWindow(pastcopyWindow, nextIndex, afterPastcopy[nextIndex])
+
+        # Pastcopy (the same after either command, apart from the bit)
+        bestPastcopySize = None
+        bestPastcopyLength = 0
+        maxLength = matchLengths[currentIndex]
+        codeLimit = 1
+        codeSize = currentIndex.bit_length() + 1
+        while codeLimit + 2 <= maxLength:
+            # Stop if even the smallest size can't do better any more.
+            if (
+                bestPastcopySize is not None
+                and pastcopyWindow[1][0] + codeSize >= bestPastcopySize
+            ):
+                break
+            codeLimit *= 2
+            codeSize += 2
+            candidate = sizewindow.searchWindow(
+                pastcopyWindow, currentIndex + min(codeLimit + 1, maxLength)
+            )
+            if candidate is None:
+                continue
+            candidateLength = candidate[1] - currentIndex
+            candidateSize = (
+                candidate[0]
+                + currentIndex.bit_length()
+                + uieSize(candidateLength - 3)
+            )
+            if bestPastcopySize is None or candidateSize < bestPastcopySize:
+                bestPastcopySize = candidateSize
+                bestPastcopyLength = candidateLength
+        afterLiteral[currentIndex] = bestPastcopySize
+        afterLiteralChoices[currentIndex] = bestPastcopyLength
+
+        # Literal bytes (always possible here, if not after a literal)
+        bestSize = None
+        bestLength = 0
+        codeLimit = 1
+        codeSize = 1 - 8 * currentIndex
+        while codeLimit <= inLength - currentIndex:
+            # Stop if even the smallest size can't do better any more.
+            if bestSize is not None and literalWindow[1][0] + codeSize >= bestSize:
+                break
+            codeLimit *= 2
+            codeSize += 2
+            candidate = sizewindow.searchWindow(
+                literalWindow, min(currentIndex + codeLimit - 1, inLength)
+            )
+            if candidate is None:
+                continue
+            candidateLength = candidate[1] - currentIndex
+            candidateSize = (
+                candidate[0]
+                - 8 * currentIndex
+                + uieSize(candidateLength - 1)
+            )
+            if bestSize is None or candidateSize < bestSize:
+                bestSize = candidateSize
+                bestLength = -candidateLength
+
+        # Every command but the first costs a bit to say what it is.
+        if currentIndex > 0 and bestSize is not None:
+            bestSize += 1
+        if bestPastcopySize is not None and (
+            bestSize is None or bestPastcopySize + 1 < bestSize
+        ):
+            bestSize = bestPastcopySize + 1
+            bestLength = bestPastcopyLength
+        afterPastcopy[currentIndex] = bestSize
+        afterPastcopyChoices[currentIndex] = bestLength
+
+    # Follow the choices from the start. (The first command is always
+    # literal, which is the same as coming after a pastcopy.)
+    currentIndex = 0
+    choices = afterPastcopyChoices
+    while currentIndex < inLength:
+        nextLength = choices[currentIndex]
+        if nextLength > 0:
+            copyLengths[currentIndex] = nextLength
+            currentIndex += nextLength
+            choices = afterPastcopyChoices
+        else:
+            currentIndex -= nextLength
+            choices = afterLiteralChoices
+
+    return copyLengths
+
+
+
+# If latestSource is True, copy each pastcopy from the latest position it
+# can be copied from, instead of the earliest. (The output is closer to
+# what's in the ROM.)
+#
+# If optimal is True, use the smallest possible output instead of always
+# taking the longest pastcopy.
+def compress(inBytes, latestSource=False, optimal=False):
+    # Find the pastcopies, and choose which ones to use.
+    matchLengths = findMatches(inBytes)
+    if optimal:
+        copyLengths = parseOptimal(matchLengths)
+    else:
+        copyLengths = parseGreedy(matchLengths)
 
     # Prepare for compression.
     dataSection = bytearray()
-    controlSection = bitstring.BitArray()
+    controlSection = bitwriter.BitWriter()
     currentIndex = 0
     currentLiteralsQueued = 0
 
     # Main compression loop.
     while currentIndex < len(inBytes):
-        bestIndex = 0
-        bestLength = 0
-
-        # Look for a match in the previously-seen data. (Brute force)
-        for i in range(0, currentIndex):
-            # Don't compare past the end of the input.
-            compareLimit = len(inBytes) - currentIndex
-
-            # Count how many sequential bytes match (possibly zero).
-            currentLength = 0
-            for j in range(compareLimit):
-                if inBytes[i + j] == inBytes[currentIndex + j]:
-                    currentLength += 1
-                else:
-                    break
-
-            # Keep track of the largest match we've seen.
-            # If you use ">=" here, the output is closer to what's in the ROM.
-            if currentLength > bestLength:
-                bestIndex = i
-                bestLength = currentLength
+        bestLength = copyLengths[currentIndex]
 
         # Process the best match.
         if bestLength >= 3:
             # Write any queued literals (possibly none).
             if currentLiteralsQueued > 0:
-                controlSection += bitstring.pack("uint:1", BIT_LITERAL)
-                controlSection += bitstring.pack("uie", currentLiteralsQueued - 1)
+                writeLiterals(controlSection, currentLiteralsQueued, currentIndex)
                 currentLiteralsQueued = 0
             else:
-                controlSection += bitstring.pack("uint:1", BIT_PASTCOPY)
+                controlSection.write(BIT_PASTCOPY, 1)
+
+            # Find where the match is. It may run past the current
+            # position, but it has to start before it.
+            matchBytes = inBytes[currentIndex:currentIndex + bestLength]
+            searchEnd = currentIndex - 1 + bestLength
+            if latestSource:
+                bestIndex = inBytes.rfind(matchBytes, 0, searchEnd)
+            else:
+                bestIndex = inBytes.find(matchBytes, 0, searchEnd)
 
             # Write the pastcopy.
-            controlSection += bitstring.pack(
-                "uint:n=v", n = currentIndex.bit_length(), v = bestIndex
-            )
-            controlSection += bitstring.pack("uie", bestLength - 3)
+            controlSection.write(bestIndex, currentIndex.bit_length())
+            controlSection.write_uie(bestLength - 3)
             currentIndex += bestLength
 
         else:
@@ -74,20 +263,18 @@ def compress(inBytes):
 
     # Write any remaining queued literals (possibly none).
     if currentLiteralsQueued > 0:
-        controlSection += bitstring.pack("uint:1", BIT_LITERAL)
-        controlSection += bitstring.pack("uie", currentLiteralsQueued - 1)
+        writeLiterals(controlSection, currentLiteralsQueued, currentIndex)
         currentLiteralsQueued = 0
 
     # Assemble the output: header, data section, control section.
-    output = bitstring.BitArray()
-    output += bitstring.pack("uintle:16", len(inBytes))
-    output += bitstring.pack("uintle:16", len(dataSection) + 2)
+    output = bytearray()
+    output += len(inBytes).to_bytes(2, "little")
+    output += (len(dataSection) + 2).to_bytes(2, "little")
     output += dataSection
-    # The first command is always literal, so we don't need to waste a bit saying so.
-    output += controlSection[1:]
+    output += controlSection.tobytes()
 
     # Return the compressed data.
-    return output.tobytes()
+    return bytes(output)
 
 
 
@@ -101,29 +288,38 @@ def touchopen(filename, *args, **kwargs):
 
 if __name__ == "__main__":
 
+    # Check for the optional "--latest" and "--optimal" flags.
+    args = sys.argv[1:]
+    latestSource = "--latest" in args
+    if latestSource:
+        args.remove("--latest")
+    optimal = "--optimal" in args
+    if optimal:
+        args.remove("--optimal")
+
     # Check for incorrect usage.
-    argc = len(sys.argv)
+    argc = len(args) + 1
     if argc < 2 or argc > 4:
-        print("Usage: {0:s} <inFile> [outFile] [outOffset]".format(
+        print("Usage: {0:s} [--latest] [--optimal] <inFile> [outFile] [outOffset]".format(
             sys.argv[0]
         ))
         sys.exit(1)
 
     # Copy the arguments.
-    inFile = sys.argv[1]
+    inFile = args[0]
     outFile = None
     if argc == 3 or argc == 4:
-        outFile = sys.argv[2]
+        outFile = args[1]
     outOffset = 0
     if argc == 4:
-        outOffset = int(sys.argv[3], 16)
+        outOffset = int(args[2], 16)
 
     # Read the input file.
     with open(inFile, "rb") as inStream:
         inBytes = bytearray(inStream.read())
 
     # Compress the data.
-    outBytes = compress(inBytes)
+    outBytes = compress(inBytes, latestSource, optimal)
 
     # Write the compressed output, if appropriate.
     if outFile is not None:
@@ -53,7 +53,8 @@
 #        01 00 01 00 00 1 --> Copy 52 bytes (binary 110100)
 #
 #   - python-bitstring supports this coding, but starts counting from
-#     0 instead of 1, so we add 1 to each value we read.
+#     0 instead of 1. So does our bit reader (which reads it the same
+#     way), so we add 1 to each value we read.
 #
 #   - If there is still data left to decompress after a literal, a
 #     pastcopy follows.
@@ -64,35 +65,38 @@
 #        absolute location to copy from.
 #      - The second is the amount. Like the literal command, it uses
 #        interleaved exponential-Golomb coding. Add 2 to this amount
-#        once you have it. (3 here, because of python-bitstring.)
+#        once you have it. (3 here, because of counting from 0.)
 #      - The third is a single bit, indicating what the next command
 #        is: 0 for a literal, and 1 for another pastcopy.
-#
-# This code uses python-bitstring:
-# https://pypi.org/project/bitstring/
 
 import sys
-import bitstring
+import bitreader
 
 
 
-def decompress(inBytes, startOffset=0):
-    # Define some useful constants.
-    BIT_LITERAL = 0
-    BIT_PASTCOPY = 1
+# Define some useful constants.
+BIT_LITERAL = 0
+BIT_PASTCOPY = 1
+
 
-    # Prepare to read the compressed bytes.
-    inStream = bitstring.ConstBitStream(bytes=inBytes)
-    inStream.bytepos += startOffset
+
+def decompress(inBytes, startOffset=0):
+    # Read the header.
+    decompSize = inBytes[startOffset + 0] | (inBytes[startOffset + 1] << 8)
+    dataSize = (inBytes[startOffset + 2] | (inBytes[startOffset + 3] << 8)) - 2
+    dataStart = startOffset + 4
+    if dataSize < 0:
+        raise ValueError("data section size is negative")
 
     # Allocate memory for the decompression process.
-    decompSize = inStream.read("uintle:16")
     decomp = bytearray([0x00] * decompSize)
     decompPos = 0
-    dataSize = inStream.read("uintle:16") - 2
-    data = inStream.read("bytes:{0:d}".format(dataSize))
+    data = bytes(inBytes[dataStart:dataStart + dataSize])
     dataPos = 0
 
+    # Prepare to read the control section.
+    inStream = bitreader.BitReader(inBytes, dataStart + dataSize)
+
     # The first command is always literal.
     nextCommand = BIT_LITERAL
 
@@ -103,7 +107,7 @@ def decompress(inBytes, startOffset=0):
         if nextCommand == BIT_LITERAL:
 
             # Read the number of bytes to copy.
-            copyAmount = inStream.read("uie") + 1
+            copyAmount = inStream.read_uie() + 1
 
             # Truncate the copy if it would exceed decompSize.
             if (decompPos + copyAmount) >= decompSize:
@@ -123,28 +127,39 @@ def decompress(inBytes, startOffset=0):
 
         # Read the source.
         copySourceLength = decompPos.bit_length()
-        copySource = inStream.read("uint:{0:d}".format(copySourceLength))
+        copySource = inStream.read(copySourceLength)
 
         # Read the amount.
-        copyAmount = inStream.read("uie") + 3
+        copyAmount = inStream.read_uie() + 3
 
         # Truncate the copy if it would exceed decompSize.
         if (decompPos + copyAmount) >= decompSize:
             copyAmount = decompSize - decompPos
 
         # Copy the bytes.
-        # The source and destination range might overlap, so copy one byte at a time.
-        for i in range(copyAmount):
-            decomp[decompPos] = decomp[copySource]
-            decompPos += 1
-            copySource += 1
+        # The source and destination range might overlap. If so, the bytes
+        # from the source onward repeat every (decompPos - copySource)
+        # bytes, so copy everything from the source up to decompPos each
+        # time, which doubles it. A source past the bytes decompressed so
+        # far reads the zeros that haven't been written over yet, all at
+        # once.
+        while copyAmount > 0:
+            copySize = copyAmount
+            if copySource < decompPos:
+                copySize = min(copySize, decompPos - copySource)
+            copyEnd = copySource + copySize
+            if max(copyEnd, decompPos + copySize) > len(decomp):
+                raise IndexError("copy past the end of the output")
+            decomp[decompPos:decompPos + copySize] = decomp[copySource:copyEnd]
+            decompPos += copySize
+            copyAmount -= copySize
 
         # If we're done, break.
         if decompPos == decompSize:
             break
 
         # Otherwise, find out what the next command is.
-        nextCommand = inStream.read("uint:1")
+        nextCommand = inStream.read(1)
 
     # Calculate the end offset.
     inStream.bytealign()
@@ -155,6 +170,65 @@ def decompress(inBytes, startOffset=0):
 
 
 
+# Like decompress(), but only work out where the compressed data ends.
+# (The decompressed size is in the header.) Nothing is decompressed:
+# the data section is skipped, and so are the pastcopy sources.
+def measure(inBytes, startOffset=0):
+    # Read the header, and skip the data section.
+    decompSize = inBytes[startOffset + 0] | (inBytes[startOffset + 1] << 8)
+    decompPos = 0
+    dataSize = (inBytes[startOffset + 2] | (inBytes[startOffset + 3] << 8)) - 2
+
+    # Prepare to read the control section.
+    inStream = bitreader.BitReader(inBytes, startOffset + 4 + dataSize)
+
+    # The first command is always literal.
+    nextCommand = BIT_LITERAL
+
+    # Main measuring loop.
+    while True:
+
+        # 0: Literal case.
+        if nextCommand == BIT_LITERAL:
+
+            # Read the number of bytes to copy.
+            copyAmount = inStream.read_uie() + 1
+
+            # Truncate the copy if it would exceed decompSize.
+            decompPos += min(copyAmount, decompSize - decompPos)
+
+            # If we're done, break.
+            # Otherwise, a pastcopy follows.
+            if decompPos == decompSize:
+                break
+
+        # 1: Pastcopy case.
+
+        # Skip the source.
+        inStream.read(decompPos.bit_length())
+
+        # Read the amount.
+        copyAmount = inStream.read_uie() + 3
+
+        # Truncate the copy if it would exceed decompSize.
+        decompPos += min(copyAmount, decompSize - decompPos)
+
+        # If we're done, break.
+        if decompPos == decompSize:
+            break
+
+        # Otherwise, find out what the next command is.
+        nextCommand = inStream.read(1)
+
+    # Calculate the end offset.
+    inStream.bytealign()
+    endOffset = inStream.bytepos
+
+    # Return the decompressed size and end offset.
+    return (decompSize, endOffset)
+
+
+
 if __name__ == "__main__":
 
     # Check for incorrect usage.
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+#
+# Size Window
+# Osteoclave
+# 2026-10-18
+#
+# A window of output sizes, for the compressors' optimal parsing: it finds
+# the smallest size from a range of positions quickly. Positions are added
+# from the end of the input backward, and a range always starts at the
+# last position added. Each position kept has a smaller size than every
+# position added after it, so the smallest size in a range belongs to the
+# furthest one kept that's still in range.
+#
+# A window is a (positions, sizes) pair of lists, starting out empty. The
+# smallest size of all is always sizes[0].
+
+import bisect
+
+
+
+# Add a position and its size to a window.
+def addToWindow(window, position, size):
+    positions, sizes = window
+    while sizes and sizes[-1] >= size:
+        positions.pop()
+        sizes.pop()
+
+    # Store the positions negated, so they're in increasing order.
+    positions.append(-position)
+    sizes.append(size)
+
+
+
+# Find the smallest size in a window, from the last position added up to
+# lastPosition (inclusive). Returns the size and its position, or None if
+# there's nothing in range.
+def searchWindow(window, lastPosition):
+    positions, sizes = window
+    i = bisect.bisect_left(positions, -lastPosition)
+    if i == len(positions):
+        return None
+    return sizes[i], -positions[i]
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+#
+# Suffix Array
+# Osteoclave
+# 2026-10-18
+#
+# Finds the longest pastcopy at every position of some data, for the
+# compressors. The suffixes of the data (the data from each position to
+# the end) are sorted, and the longest match for a position is with one
+# of the two closest suffixes, above and below it in sorted order, that
+# can be copied from. The length of the match is the smallest common
+# prefix length in between.
+#
+# Several strings can be sorted together, by concatenating them and
+# giving the positions where each one ends (the boundaries). Suffixes
+# stop at the end of their own string, so a match never runs from one
+# string into the next. This lets one string be searched for pastcopies
+# from another, such as the same data with its bits reversed.
+
+import bisect
+
+
+
+# How many bytes the suffixes are ranked by to start with, and how many
+# bits it takes to store the length of a suffix that short.
+INITIAL_LENGTH = 32
+LENGTH_BITS = 6
+
+
+
+# Split n bytes into strings at the boundaries. Returns the (start, end)
+# of each string.
+def splitStrings(n, boundaries):
+    strings = []
+    stringStart = 0
+    for stringEnd in sorted(set(boundaries) | {n}):
+        if stringEnd > stringStart:
+            strings.append((stringStart, stringEnd))
+        stringStart = stringEnd
+    return strings
+
+
+
+# Find where the string containing each position ends.
+def findStringEnds(strings):
+    stringEnds = []
+    for stringStart, stringEnd in strings:
+        stringEnds += [stringEnd] * (stringEnd - stringStart)
+    return stringEnds
+
+
+
+# Give a run of sortedOrder (from start onward, with sortedKeys) ranks:
+# suffixes with the same key share a rank, which is one more than where
+# the first of them is in sortedOrder. (Rank 0 is for suffixes that have
+# run out.) Runs of suffixes that share a rank are added to unsortedRuns.
+def rankSortedRun(sortedOrder, sortedKeys, start, ranks, unsortedRuns):
+    runStart = 0
+    for k in range(1, len(sortedKeys) + 1):
+        if k < len(sortedKeys) and sortedKeys[k] == sortedKeys[runStart]:
+            continue
+        currentRank = start + runStart + 1
+        for i in sortedOrder[start + runStart:start + k]:
+            ranks[i] = currentRank
+        if k - runStart > 1:
+            unsortedRuns.append((start + runStart, start + k))
+        runStart = k
+
+
+
+# Sort the suffixes of a byte string. Returns the positions in sorted
+# order. (Identical suffixes of different strings are in string order.)
+#
+# Suffixes are sorted by their first few bytes, and then by prefix
+# doubling: once suffixes are sorted by their first k bytes, the ones
+# that are still tied can be sorted by their first 2k bytes, by the rank
+# of the suffix k bytes later. Ranks are kept up to date as ties are
+# broken. (Larsson and Sadakane's method: only the suffixes still tied
+# are sorted each time, and updating the ranks early only helps.)
+def buildSuffixArray(inBytes, boundaries=()):
+    n = len(inBytes)
+    strings = splitStrings(n, boundaries)
+    stringEnds = findStringEnds(strings)
+
+    # Short suffixes (up to INITIAL_LENGTH bytes) are padded with zeros, and
+    # then ranked by length, so a suffix that's a prefix of another comes
+    # before it. Identical short suffixes are ranked by which string
+    # they're in, so that every suffix ends up with its own rank.
+    stringCount = len(strings)
+    padded = bytes(inBytes) + bytes(INITIAL_LENGTH)
+    keys = [
+        (
+            (int.from_bytes(padded[i:i + INITIAL_LENGTH], "big") << LENGTH_BITS)
+            | (INITIAL_LENGTH + 1)
+        ) * stringCount
+        for i in range(n)
+    ]
+    for stringIndex, (stringStart, stringEnd) in enumerate(strings):
+        for i in range(max(stringEnd - INITIAL_LENGTH, stringStart), stringEnd):
+            suffixLength = stringEnd - i
+            paddingBits = 8 * (INITIAL_LENGTH - suffixLength)
+            keys[i] = (
+                (
+                    (int.from_bytes(padded[i:stringEnd], "big") << (LENGTH_BITS + paddingBits))
+                    | suffixLength
+                ) * stringCount
+                + stringIndex
+            )
+
+    sortedOrder = sorted(range(n), key=keys.__getitem__)
+    ranks = [0] * n
+    unsortedRuns = []
+    rankSortedRun(sortedOrder, list(map(keys.__getitem__, sortedOrder)), 0, ranks, unsortedRuns)
+    del keys
+
+    prefixLength = INITIAL_LENGTH
+    while unsortedRuns:
+        currentRuns = unsortedRuns
+        unsortedRuns = []
+        for start, end in currentRuns:
+            # Sort the run by the rank of the suffix prefixLength bytes
+            # later (0 if that's past the end of the string).
+            runKeys = [
+                (ranks[i + prefixLength] if i + prefixLength < stringEnds[i] else 0, i)
+                for i in sortedOrder[start:end]
+            ]
+            runKeys.sort()
+            sortedOrder[start:end] = [i for _, i in runKeys]
+            rankSortedRun(
+                sortedOrder, [laterRank for laterRank, _ in runKeys], start, ranks, unsortedRuns
+            )
+        prefixLength *= 2
+
+    return sortedOrder
+
+
+
+# Find the longest common prefix of each suffix and the one before it in
+# sorted order. (Kasai's algorithm: going from a suffix to the one after
+# it in the data, the common prefix only gets one byte shorter at most.)
+def buildLcpArray(inBytes, suffixArray, boundaries=()):
+    n = len(inBytes)
+    stringEnds = findStringEnds(splitStrings(n, boundaries))
+    suffixRanks = [0] * n
+    for currentRank, i in enumerate(suffixArray):
+        suffixRanks[i] = currentRank
+
+    lcpArray = [0] * n
+    currentLength = 0
+    for i in range(n):
+        currentRank = suffixRanks[i]
+        if currentRank == 0:
+            currentLength = 0
+            continue
+        j = suffixArray[currentRank - 1]
+        while (
+            i + currentLength < stringEnds[i]
+            and j + currentLength < stringEnds[j]
+            and inBytes[i + currentLength] == inBytes[j + currentLength]
+        ):
+            currentLength += 1
+        lcpArray[currentRank] = currentLength
+        if currentLength > 0:
+            currentLength -= 1
+
+    return lcpArray
+
+
+
+# Find the longest pastcopy for every target. The targets are the suffixes
+# at positions 0 to (targetCount - 1). A pastcopy for the target at
+# position i can come from any suffix j where sourcePositions[j] is less
+# than i (None if suffix j can't be copied from).
+#
+# Returns two lists: the length of the longest match for each target, and
+# the source position (from sourcePositions) of one where it can be found.
+def findMatches(suffixArray, lcpArray, targetCount, sourcePositions):
+    matchLengths = [0] * targetCount
+    matchSources = [0] * targetCount
+    longest = len(suffixArray)
+
+    # Only the targets and sources matter. Keep those (in sorted order),
+    # and the common prefix of each with the one kept before it, which is
+    # the smallest in between in the full array.
+    keptSuffixes = []
+    keptLcps = []
+    currentLength = 0
+    for i, nextLength in zip(suffixArray, lcpArray):
+        if nextLength < currentLength:
+            currentLength = nextLength
+        if i < targetCount or sourcePositions[i] is not None:
+            keptSuffixes.append(i)
+            keptLcps.append(currentLength)
+            currentLength = longest
+
+    # Going forward, each suffix's common prefix with the one before it is
+    # kept with it. Going backward, it's the one with the suffix after it.
+    sweeps = (
+        zip(keptSuffixes, keptLcps),
+        zip(reversed(keptSuffixes), reversed(keptLcps[1:] + [0])),
+    )
+    for sweep in sweeps:
+        # The positions on the stack are in increasing order. Any position
+        # after a newly-added one is useless from now on, because the new
+        # one is both earlier and closer in sorted order.
+        #
+        # The common prefix of each one on the stack with the current
+        # suffix only gets shorter going down the stack (further away in
+        # sorted order), so it's kept as runs: runLengths[k] is the length
+        # from stack index runStarts[k] up to the next run.
+        stackPositions = []
+        runStarts = []
+        runLengths = []
+        for i, nextLength in sweep:
+            # Moving to this suffix shortens the common prefixes to (at
+            # most) the one between it and the last suffix.
+            if runLengths and runLengths[-1] > nextLength:
+                runStart = runStarts.pop()
+                runLengths.pop()
+                while runLengths and runLengths[-1] > nextLength:
+                    runStart = runStarts.pop()
+                    runLengths.pop()
+                runStarts.append(runStart)
+                runLengths.append(nextLength)
+
+            if i < targetCount:
+                # The closest source before the current position is the
+                # last one on the stack with a smaller position.
+                stackIndex = bisect.bisect_left(stackPositions, i) - 1
+                if stackIndex >= 0:
+                    currentLength = runLengths[bisect.bisect_right(runStarts, stackIndex) - 1]
+
+                    # Keep track of the largest match we've seen.
+                    if currentLength > matchLengths[i]:
+                        matchLengths[i] = currentLength
+                        matchSources[i] = stackPositions[stackIndex]
+
+            sourcePosition = sourcePositions[i]
+            if sourcePosition is None:
+                continue
+            if stackPositions and stackPositions[-1] > sourcePosition:
+                stackIndex = bisect.bisect_left(stackPositions, sourcePosition)
+                del stackPositions[stackIndex:]
+                while runStarts and runStarts[-1] >= stackIndex:
+                    runStarts.pop()
+                    runLengths.pop()
+            runStarts.append(len(stackPositions))
+            runLengths.append(longest)
+            stackPositions.append(sourcePosition)
+
+    return matchLengths, matchSources
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+#
+# Terranigma Compressor
+# Osteoclave
+# 2026-10-18
+#
+# The compression format is described in the decompressor.
+#
+# Pastcopies are found with hash chains: every position is linked to the
+# closest earlier position that starts with the same three bytes, and the
+# links are followed back until they're out of the 8 KB window. (Two-byte
+# pastcopies are only worth it as a Pastcopy B, so those come from a
+# second set of links, by the first two bytes.) Then the commands are
+# chosen to give the smallest possible output.
+
+import os
+import sys
+
+
+
+# Define some useful constants.
+BIT_LITERAL = 1
+BIT_PASTCOPY = 0
+BIT_PASTCOPY_A = 1
+BIT_PASTCOPY_B = 0
+
+# How far back each pastcopy can reach.
+PASTCOPY_A_WINDOW = 0x2000
+PASTCOPY_B_WINDOW = 0x100
+
+# How long each pastcopy can be. (Pastcopy A has a normal length, and a
+# longer one that takes an extra byte.)
+PASTCOPY_A_MIN_LENGTH = 3
+PASTCOPY_A_MAX_LENGTH = 9
+PASTCOPY_A_LONG_MIN_LENGTH = 2
+PASTCOPY_A_LONG_MAX_LENGTH = 256
+PASTCOPY_B_MIN_LENGTH = 2
+PASTCOPY_B_MAX_LENGTH = 5
+
+# The size of each command, in bits (counting its control bits).
+LITERAL_SIZE = 1 + 8
+PASTCOPY_A_SIZE = 2 + 16
+PASTCOPY_A_LONG_SIZE = 2 + 24
+PASTCOPY_B_SIZE = 4 + 8
+
+# How many earlier positions to look at for each one, at most.
+DEFAULT_MAX_CHAIN = 32
+
+
+
+# Link every position to the closest earlier position where the same
+# keyLength bytes start (or -1 if there isn't one).
+def buildChains(inBytes, keyLength):
+    previousPositions = [-1] * len(inBytes)
+    lastPositions = {}
+    for currentIndex in range(len(inBytes) - keyLength + 1):
+        key = bytes(inBytes[currentIndex:currentIndex + keyLength])
+        previousPositions[currentIndex] = lastPositions.get(key, -1)
+        lastPositions[key] = currentIndex
+    return previousPositions
+
+
+
+# Find the pastcopies at every position. For each position, there's a list
+# of (distance, length) pairs. Sources are looked at from the closest back,
+# and one is only listed if it's longer than all the closer ones, so both
+# go up along the list. The closest source for any length is the first one
+# listed that's at least that long.
+#
+# At most maxChain earlier positions are looked at for each position. A
+# longer chain might find longer (more distant) matches, but it's slower.
+# This is most of the time compress() takes: with the default chain, a
+# 64 KB block takes about 0.3 seconds if there's little to copy, and up to
+# 1 to 2 seconds (depending on the machine) if almost everything repeats.
+def findMatches(inBytes, maxChain=DEFAULT_MAX_CHAIN):
+    inBytes = bytes(inBytes)
+    endIndex = len(inBytes)
+    matchTable = [[] for i in range(endIndex)]
+    tripleChains = buildChains(inBytes, 3)
+    pairChains = buildChains(inBytes, 2)
+
+    # The first byte is in the header, so it's never a pastcopy.
+    for currentIndex in range(1, endIndex):
+        matches = matchTable[currentIndex]
+
+        # Don't look too far ahead.
+        lookaheadLimit = min(PASTCOPY_A_LONG_MAX_LENGTH, endIndex - currentIndex)
+        if lookaheadLimit < 2:
+            continue
+
+        # A two-byte match is only useful if it's close enough for a
+        # Pastcopy B.
+        source = pairChains[currentIndex]
+        if source >= 0 and currentIndex - source <= PASTCOPY_B_WINDOW:
+            # (Three bytes might match, too. If so, the search below will
+            # find that again.)
+            matches.append((currentIndex - source, 2))
+        if lookaheadLimit < 3:
+            continue
+
+        # Sources are compared with the data from here the same way as
+        # matchLength() in nes/mckids_comp.py does it, but inline, and with
+        # the data from here only turned into an int once.
+        shortLimit = min(lookaheadLimit, 16)
+        shortKey = None
+        longKey = None
+
+        # Look at the closest positions first, so that the first match of
+        # each length is the closest one. Don't look too far back.
+        bestLength = 2 if matches else 0
+        windowStart = max(currentIndex - PASTCOPY_A_WINDOW, 0)
+        source = tripleChains[currentIndex]
+        for chainLength in range(maxChain):
+            if source < windowStart:
+                break
+
+            # A match can only be longer than the best one so far if the
+            # byte just past that matches too.
+            if inBytes[source + bestLength] == inBytes[currentIndex + bestLength]:
+                if shortKey is None:
+                    shortKey = int.from_bytes(
+                        inBytes[currentIndex:currentIndex + shortLimit], "big"
+                    )
+                difference = shortKey ^ int.from_bytes(inBytes[source:source + shortLimit], "big")
+                if difference != 0:
+                    currentLength = shortLimit - ((difference.bit_length() + 7) >> 3)
+                else:
+                    if longKey is None:
+                        longKey = int.from_bytes(
+                            inBytes[currentIndex:currentIndex + lookaheadLimit], "big"
+                        )
+                    difference = longKey ^ int.from_bytes(
+                        inBytes[source:source + lookaheadLimit], "big"
+                    )
+                    currentLength = lookaheadLimit - ((difference.bit_length() + 7) >> 3)
+
+                if currentLength > bestLength:
+                    distance = currentIndex - source
+                    if bestLength == 2 and matches[0][0] >= distance:
+                        # This one is at least as close as the two-byte match.
+                        matches[0] = (distance, currentLength)
+                    else:
+                        matches.append((distance, currentLength))
+                    bestLength = currentLength
+
+                    # If we've found a maximum-possible-length match, break.
+                    if bestLength == lookaheadLimit:
+                        break
+
+            source = tripleChains[source]
+
+    return matchTable
+
+
+
+# Work out the cheapest way to copy length bytes from distance bytes back.
+# Returns the size in bits, or None if it can't be done.
+def pastcopySize(distance, length):
+    if PASTCOPY_B_MIN_LENGTH <= length <= PASTCOPY_B_MAX_LENGTH and distance <= PASTCOPY_B_WINDOW:
+        return PASTCOPY_B_SIZE
+    if PASTCOPY_A_MIN_LENGTH <= length <= PASTCOPY_A_MAX_LENGTH:
+        return PASTCOPY_A_SIZE
+    if PASTCOPY_A_LONG_MIN_LENGTH <= length <= PASTCOPY_A_LONG_MAX_LENGTH:
+        return PASTCOPY_A_LONG_SIZE
+    return None
+
+
+
+# Choose the commands by finding the smallest possible output. Work
+# backward from the end: the best output from each position is the
+# smallest of (size of a literal) + (best output from the next position),
+# or (size of a pastcopy) + (best output from where it ends), for every
+# pastcopy possible. Each length is copied from the closest source that's
+# long enough. Pastcopies of more than 9 bytes all cost the same, so for
+# those, only the longest one from each source is tried. (Trying every
+# length would be much slower, for very little gain.)
+#
+# Returns a list with the (distance, length) of the pastcopy at every
+# position ((0, 0) for a literal).
+def parseOptimal(matchTable):
+    endIndex = len(matchTable)
+    copies = [(0, 0)] * endIndex
+    bestSizes = [0] * (endIndex + 1)
+
+    # The size of each pastcopy of up to 9 bytes, by length: one list for
+    # sources close enough for a Pastcopy B, and one for the rest.
+    shortLengths = range(PASTCOPY_A_MAX_LENGTH + 1)
+    nearSizes = [pastcopySize(PASTCOPY_B_WINDOW, length) for length in shortLengths]
+    farSizes = [pastcopySize(PASTCOPY_B_WINDOW + 1, length) for length in shortLengths]
+
+    for currentIndex in range(endIndex - 1, 0, -1):
+        bestSize = bestSizes[currentIndex + 1] + LITERAL_SIZE
+        bestCopy = (0, 0)
+
+        lengthStart = PASTCOPY_B_MIN_LENGTH
+        for distance, maxLength in matchTable[currentIndex]:
+            # Shorter lengths were covered by closer sources.
+            sizes = nearSizes if distance <= PASTCOPY_B_WINDOW else farSizes
+            for length in range(lengthStart, min(maxLength, PASTCOPY_A_MAX_LENGTH) + 1):
+                candidateSize = bestSizes[currentIndex + length] + sizes[length]
+                if candidateSize < bestSize:
+                    bestSize = candidateSize
+                    bestCopy = (distance, length)
+            if maxLength > PASTCOPY_A_MAX_LENGTH:
+                candidateSize = bestSizes[currentIndex + maxLength] + PASTCOPY_A_LONG_SIZE
+                if candidateSize < bestSize:
+                    bestSize = candidateSize
+                    bestCopy = (distance, maxLength)
+            lengthStart = maxLength + 1
+
+        bestSizes[currentIndex] = bestSize
+        copies[currentIndex] = bestCopy
+
+    return copies
+
+
+
+# Compress some data. The mystery byte in the header is 0x00 unless
+# another one is given. (See findMatches() for maxChain.)
+def compress(inBytes, mysteryByte=0x00, maxChain=DEFAULT_MAX_CHAIN):
+    if not 1 <= len(inBytes) <= 0xFFFF:
+        raise ValueError("data must be 1 to 65535 bytes long")
+
+    # Find the pastcopies, and choose which ones to use.
+    matchTable = findMatches(inBytes, maxChain)
+    copies = parseOptimal(matchTable)
+
+    # Write the header.
+    output = bytearray()
+    output.append(mysteryByte)
+    output += len(inBytes).to_bytes(2, "little")
+    output.append(inBytes[0])
+
+    # Control bits go into a control byte, which goes into the output just
+    # before the arguments of the command that needs it. (So a command's
+    # control bits can be split across two control bytes.)
+    controlPos = 0
+    controlMask = 0x00
+
+    def writeControlBits(bits, bitCount):
+        nonlocal controlPos, controlMask
+        for i in range(bitCount - 1, -1, -1):
+            if controlMask == 0x00:
+                controlPos = len(output)
+                output.append(0x00)
+                controlMask = 0x80
+            if (bits >> i) & 1:
+                output[controlPos] |= controlMask
+            controlMask >>= 1
+
+    # Main compression loop.
+    currentIndex = 1
+    while currentIndex < len(inBytes):
+        distance, length = copies[currentIndex]
+        copySize = 0
+        if length > 0:
+            copySize = pastcopySize(distance, length)
+
+        if copySize == 0:
+            # (1) - Literal case
+            writeControlBits(BIT_LITERAL, 1)
+            output.append(inBytes[currentIndex])
+            currentIndex += 1
+            continue
+
+        if copySize == PASTCOPY_B_SIZE:
+            # (00xx) - Pastcopy B case
+            writeControlBits(
+                (BIT_PASTCOPY << 3) | (BIT_PASTCOPY_B << 2) | (length - PASTCOPY_B_MIN_LENGTH),
+                4,
+            )
+            output.append(PASTCOPY_B_WINDOW - distance)
+
+        elif copySize == PASTCOPY_A_SIZE:
+            # (01) - Pastcopy A case
+            writeControlBits((BIT_PASTCOPY << 1) | BIT_PASTCOPY_A, 2)
+            argument = ((PASTCOPY_A_WINDOW - distance) << 3) | (length - 2)
+            output += argument.to_bytes(2, "big")
+
+        else:
+            # (01) - Pastcopy A case, with the length in an extra byte
+            writeControlBits((BIT_PASTCOPY << 1) | BIT_PASTCOPY_A, 2)
+            argument = (PASTCOPY_A_WINDOW - distance) << 3
+            output += argument.to_bytes(2, "big")
+            output.append(length - 1)
+
+        currentIndex += length
+
+    # Write the terminating command: a Pastcopy A with both lengths zero.
+    writeControlBits((BIT_PASTCOPY << 1) | BIT_PASTCOPY_A, 2)
+    output += bytes(3)
+
+    # Return the compressed data.
+    return output
+
+
+
+# Open a file for reading and writing. If the file doesn't exist, create it.
+# (Vanilla open() with mode "r+" raises an error if the file doesn't exist.)
+def touchopen(filename, *args, **kwargs):
+    fd = os.open(filename, os.O_RDWR | os.O_CREAT)
+    return os.fdopen(fd, *args, **kwargs)
+
+
+
+if __name__ == "__main__":
+
+    # Check for incorrect usage.
+    argc = len(sys.argv)
+    if argc < 2 or argc > 4:
+        print("Usage: {0:s} <inFile> [outFile] [outOffset]".format(
+            sys.argv[0]
+        ))
+        sys.exit(1)
+
+    # Copy the arguments.
+    inFile = sys.argv[1]
+    outFile = None
+    if argc == 3 or argc == 4:
+        outFile = sys.argv[2]
+    outOffset = 0
+    if argc == 4:
+        outOffset = int(sys.argv[3], 16)
+
+    # Read the input file.
+    with open(inFile, "rb") as inStream:
+        inBytes = bytearray(inStream.read())
+
+    # Compress the data.
+    outBytes = compress(inBytes)
+
+    # Write the compressed output, if appropriate.
+    if outFile is not None:
+        with touchopen(outFile, "r+b") as outStream:
+            outStream.seek(outOffset)
+            outStream.write(outBytes)
+            lastOffset = outStream.tell()
+            print("Last offset written, inclusive: {0:X}".format(
+                lastOffset - 1
+            ))
+
+    # Report statistics on the data.
+    print("Uncompressed size: 0x{0:X} ({0:d}) bytes".format(len(inBytes)))
+    print("Compressed size: 0x{0:X} ({0:d}) bytes".format(len(outBytes)))
+    print("Ratio: {0:f}".format(len(outBytes) / len(inBytes)))
+
+    # Exit.
+    sys.exit(0)
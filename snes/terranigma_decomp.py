@@ -192,6 +192,84 @@ def decompress(inBytes, startOffset=0):
 
 
 
+# Like decompress(), but only work out where the compressed data ends.
+# (The decompressed size is in the header.) Nothing is decompressed:
+# the commands are read, and literal bytes and sources are skipped over.
+def measure(inBytes, startOffset=0):
+    # Prepare to read the compressed bytes.
+    inStream = bitstring.ConstBitStream(bytes=inBytes)
+    inStream.bytepos = startOffset
+
+    # Header - Mystery byte
+    mysteryByte = inStream.read("uint:8")
+    if (mysteryByte != 0x00) and (mysteryByte != 0x01):
+        raise ValueError(
+            "Unknown mystery-byte value: 0x{:02X}".format(mysteryByte)
+        )
+
+    # Header - Size of the decompressed data
+    decompSize = inStream.read("uintle:16")
+    controlByte = 0x00
+    controlMask = 0x00
+
+    # Header - First byte of the decompressed output
+    inStream.pos += 8
+
+    # Main measuring loop.
+    while True:
+        # Get the next control bit
+        if controlMask == 0x00:
+            controlByte = inStream.read("uint:8")
+            controlMask = 0x80
+        nextBit = bool(controlByte & controlMask)
+        controlMask >>= 1
+
+        # Determine the next command
+        if nextBit == True:
+            # (1) - Literal case
+            inStream.pos += 8
+
+        else:
+            # (0) - Pastcopy cases
+            if controlMask == 0x00:
+                controlByte = inStream.read("uint:8")
+                controlMask = 0x80
+            nextBit = bool(controlByte & controlMask)
+            controlMask >>= 1
+
+            if nextBit == True:
+                # (01) - Pastcopy A case
+
+                # Copy source
+                inStream.pos += 13
+
+                # Copy length (remember the zero-length case, which ends
+                # the data)
+                if inStream.read("uint:3") == 0:
+                    if inStream.read("uint:8") == 0:
+                        break
+
+            else:
+                # (00xx) - Pastcopy B case
+                # Skip the command's argument bits (the copy length)
+                for i in range(2):
+                    if controlMask == 0x00:
+                        controlByte = inStream.read("uint:8")
+                        controlMask = 0x80
+                    controlMask >>= 1
+
+                # Copy source
+                inStream.pos += 8
+
+    # Calculate the end offset.
+    inStream.bytealign()
+    endOffset = inStream.bytepos
+
+    # Return the decompressed size and end offset.
+    return (decompSize, endOffset)
+
+
+
 if __name__ == "__main__":
 
     # Check for incorrect usage.